@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import threading
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
+
+import memory as db
+from instrumentation import telemetry
+import travel_agency_bot_engine as chatbot
+
+MAX_CONCURRENT_TURNS = int(os.getenv("NOMAD_MAX_CONCURRENT_TURNS", "4"))
+MAX_QUEUED_TURNS = int(os.getenv("NOMAD_MAX_QUEUED_TURNS", "32"))
+DB_PATH = os.getenv("NOMAD_DB_PATH", "chat_history.db")
+
+
+class ChatRequest(BaseModel):
+    message: str
+    conversation_id: Optional[str] = None
+
+
+class TurnLimiter:
+    """
+    Bounded concurrency for chat turns. At most max_concurrent turns run at once and at most
+    max_queued wait for a slot; further requests are rejected so the load balancer can retry elsewhere.
+    """
+
+    def __init__(self, max_concurrent, max_queued):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_queued = max_queued
+        self.queued = 0
+
+    async def acquire(self):
+        if self.queued >= self.max_queued:
+            raise HTTPException(status_code=503, detail="Server is busy, try again later", headers={"Retry-After": "1"})
+        self.queued += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+    def release(self):
+        self.semaphore.release()
+
+    def releaser(self):
+        """
+        Return a coroutine function releasing an acquired slot on its first call only, for slots
+        that several code paths may end.
+        """
+        released = False
+
+        async def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release()
+        return release
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class BotService:
+    """
+    Holds the bot, the chat history database and the worker threads running turns.
+    """
+
+    def __init__(self):
+        self.bot = None
+        self.db = None
+        self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TURNS, thread_name_prefix="api-turn")
+        self.limiter = TurnLimiter(MAX_CONCURRENT_TURNS, MAX_QUEUED_TURNS)
+        self.conversation_locks = weakref.WeakValueDictionary()
+
+    def start(self):
+        """
+        Open the database and start the bot. Ingestion and model warm-up run on the bot's start-up thread.
+        """
+        self.db = db.ChatHistoryDB(DB_PATH, write_behind=True)
+        self.db.create_table("chat_history")
+        self.bot = chatbot.TravelAgencyBot(background=True)
+
+    @property
+    def startup_error(self):
+        return self.bot.startup_error if self.bot is not None else None
+
+    def require_ready(self):
+        if self.bot is None or not self.bot.ready.is_set():
+            raise HTTPException(status_code=503, detail="Bot is warming up", headers={"Retry-After": "5"})
+
+    def conversation_lock(self, conversation_id):
+        # Turns of one conversation are serialised so messages are appended in order
+        return self.conversation_locks.setdefault(conversation_id, asyncio.Lock())
+
+    def open_conversation(self, conversation_id, request):
+        """
+        Load the conversation from the database or start a new one, and append the user message.
+        Must be called while holding the conversation lock.
+        """
+        chat = self.db.read_chat(conversation_id)
+        if chat is None:
+            chat = {
+                "conversation_id": conversation_id,
+                "header": request.message if len(request.message) <= 30 else request.message[:30] + "...",
+                "create_date": datetime.now().isoformat(),
+                "history": [],
+                "summary": {},
+            }
+        chat["history"].append({"role": "human", "content": request.message, "create_date": datetime.now().isoformat()})
+        return chat
+
+    def finish_turn(self, chat, answer, metrics):
+        chat["history"].append({"role": "assistant", "content": answer, "create_date": datetime.now().isoformat(), "metrics": metrics})
+        self.db.save_chat_history([chat])
+
+    def run_turn(self, chat, message):
+        metrics = {}
+        answer = "".join(self.bot.stream_user_input(message, chat["history"], metrics=metrics, summary_state=chat["summary"]))
+        self.finish_turn(chat, answer, metrics)
+        return answer, metrics
+
+
+service = BotService()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # The bot warms up in the background, so the process accepts health checks immediately
+    service.start()
+    yield
+    service.executor.shutdown(wait=True)
+    if service.db is not None:
+        service.db.close_connection()
+
+
+app = FastAPI(title="Nomad AI", lifespan=lifespan)
+
+
+@app.get("/health/live")
+async def live():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def ready():
+    if service.startup_error is not None:
+        raise HTTPException(status_code=500, detail=f"Startup failed: {service.startup_error}")
+    service.require_ready()
+    return {"status": "ready", "startup": service.bot.startup_profile}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    service.require_ready()
+    loop = asyncio.get_running_loop()
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    async with service.limiter.slot():
+        async with service.conversation_lock(conversation_id):
+            chat = await loop.run_in_executor(None, service.open_conversation, conversation_id, request)
+            answer, metrics = await loop.run_in_executor(service.executor, service.run_turn, chat, request.message)
+    return {"conversation_id": conversation_id, "answer": answer, "metrics": metrics}
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    service.require_ready()
+    loop = asyncio.get_running_loop()
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    # The slot is taken before the response starts, so a full queue is still reported as 503.
+    # Once the turn runs on the executor it holds the slot and the conversation lock until it
+    # has finished, even if the client is gone by then, so neither the concurrency limit nor
+    # the order of turns in a conversation depends on how long the client stays connected
+    await service.limiter.acquire()
+    release = service.limiter.releaser()
+    stopped = threading.Event()
+    turn = None
+
+    async def close():
+        # Runs when the stream ends, and as the response's background task also when the client
+        # disconnected before the stream started; whichever runs first frees the slot
+        stopped.set()
+        if turn is None:
+            await release()
+
+    async def events():
+        nonlocal turn
+        lock = service.conversation_lock(conversation_id)
+        try:
+            await lock.acquire()
+            try:
+                chat = await loop.run_in_executor(None, service.open_conversation, conversation_id, request)
+                yield _sse("start", {"conversation_id": conversation_id})
+                tokens = asyncio.Queue()
+                metrics = {}
+
+                def produce():
+                    # Runs in a worker thread and hands tokens over to the event loop
+                    parts = []
+                    try:
+                        for token in service.bot.stream_user_input(
+                                request.message, chat["history"], metrics=metrics, summary_state=chat["summary"]):
+                            if stopped.is_set():
+                                # The client is gone; closing the bot's generator ends the turn unsaved
+                                return
+                            parts.append(token)
+                            loop.call_soon_threadsafe(tokens.put_nowait, ("token", token))
+                        service.finish_turn(chat, "".join(parts), metrics)
+                        loop.call_soon_threadsafe(tokens.put_nowait, ("done", metrics))
+                    except Exception as e:
+                        loop.call_soon_threadsafe(tokens.put_nowait, ("error", str(e)))
+
+                def turn_finished(_):
+                    lock.release()
+                    loop.create_task(release())
+
+                turn = loop.run_in_executor(service.executor, produce)
+                turn.add_done_callback(turn_finished)
+                while True:
+                    event, data = await tokens.get()
+                    yield _sse(event, data)
+                    if event != "token":
+                        break
+            finally:
+                if turn is None:
+                    lock.release()
+        finally:
+            await close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", background=BackgroundTask(close))
+
+
+@app.get("/conversations")
+async def conversations(limit: int = 20, before_create_date: Optional[str] = None, before_id: Optional[str] = None):
+    service.require_ready()
+    before = {"create_date": before_create_date, "conversation_id": before_id} if before_create_date and before_id else None
+    return await asyncio.get_running_loop().run_in_executor(
+        None, lambda: service.db.read_chat_headers(limit=min(limit, 100), before=before))
+
+
+@app.get("/conversations/{conversation_id}")
+async def conversation(conversation_id: str):
+    service.require_ready()
+    chat = await asyncio.get_running_loop().run_in_executor(None, service.db.read_chat, conversation_id)
+    if chat is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return chat
@@ -0,0 +1,140 @@
+"""
+Compare the reranker and toxicity classifier backends (torch fp32, ONNX fp32, ONNX int8) on CPU.
+
+For every backend the script reports single-request latency, throughput under concurrent load
+with and without micro-batching, and agreement with the torch model, which is the reference:
+label agreement and score difference for toxicity, top-1 agreement and top-k overlap for reranking.
+
+    python benchmark_inference.py --backends torch onnx-int8 --concurrency 8 --output bench.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference import BACKENDS
+from model_registry import load_reranker, load_toxicity_pipeline
+
+TOP_K = 5
+CANDIDATES = 10
+
+
+def load_inputs(faq_path, texts_path=None, limit=200):
+    """
+    Build benchmark inputs from the FAQ: questions are queries and texts to classify,
+    answers are the documents to rerank. Extra texts can be given as JSONL with a 'text' field.
+    """
+    with open(faq_path, "r", encoding="utf-8") as f:
+        faq = json.load(f)
+    texts = [entry["question"] for entry in faq]
+    if texts_path:
+        with open(texts_path, "r", encoding="utf-8") as f:
+            texts += [json.loads(line)["text"] for line in f if line.strip()]
+    answers = [entry["answer"] for entry in faq]
+    queries = []
+    for i, entry in enumerate(faq[:limit]):
+        # The matching answer among its neighbours, so the ranking has a clear winner
+        documents = [answers[(i + offset) % len(answers)] for offset in range(CANDIDATES)]
+        queries.append((entry["question"], documents))
+    return texts[:limit], queries
+
+
+def measure(call, inputs, concurrency):
+    """
+    Run call over inputs sequentially and concurrently.
+
+    Returns:
+        tuple: (results of the sequential run, latency and throughput figures)
+    """
+    latencies = []
+    results = []
+    for item in inputs:
+        start = time.perf_counter()
+        results.append(call(item))
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, inputs))
+    concurrent_time = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return results, {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "sequential_per_s": float(len(inputs) / (latencies.sum() / 1000)),
+        "concurrent_per_s": len(inputs) / concurrent_time,
+    }
+
+
+def toxicity_agreement(results, reference):
+    labels = np.mean([result["label"] == ref["label"] for result, ref in zip(results, reference)])
+    scores = np.mean([abs(result["score"] - ref["score"]) for result, ref in zip(results, reference)
+                      if result["label"] == ref["label"]] or [0.0])
+    return {"label_agreement": float(labels), "mean_score_diff": float(scores)}
+
+
+def rerank_agreement(results, reference):
+    overlap = np.mean([
+        len({entry["corpus_id"] for entry in result} & {entry["corpus_id"] for entry in ref}) / TOP_K
+        for result, ref in zip(results, reference)
+    ])
+    top1 = np.mean([result[0]["corpus_id"] == ref[0]["corpus_id"] for result, ref in zip(results, reference)])
+    return {"top1_agreement": float(top1), f"top{TOP_K}_overlap": float(overlap)}
+
+
+def benchmark(name, loader, call, inputs, agreement, backends, concurrency, batch_wait_ms):
+    report = {}
+    reference = None
+    for backend in backends:
+        start = time.perf_counter()
+        model = loader(backend=backend, batch_wait_ms=0)
+        load_seconds = time.perf_counter() - start
+        results, figures = measure(lambda item: call(model, item), inputs, concurrency)
+        entry = {"load_seconds": load_seconds, **figures}
+
+        batched = loader(backend=backend, batch_wait_ms=batch_wait_ms)
+        _, batched_figures = measure(lambda item: call(batched, item), inputs, concurrency)
+        entry["batched_concurrent_per_s"] = batched_figures["concurrent_per_s"]
+
+        if backend == "torch":
+            reference = results
+        elif reference is not None:
+            entry.update(agreement(results, reference))
+        report[backend] = entry
+        print(f"{name:<10}{backend:<11}p50 {entry['p50_ms']:8.1f} ms  p95 {entry['p95_ms']:8.1f} ms  "
+              f"{entry['concurrent_per_s']:7.1f}/s  batched {entry['batched_concurrent_per_s']:7.1f}/s")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reranker and toxicity inference backends.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--faq", default=os.path.join("data", "faq.json"))
+    parser.add_argument("--texts", default=None, help="Extra JSONL texts to classify, e.g. labelled toxic examples")
+    parser.add_argument("--limit", type=int, default=200, help="Number of texts and queries")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0)
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Accuracy is measured against torch, so it runs first when selected
+    backends = sorted(args.backends, key=lambda backend: backend != "torch")
+    texts, queries = load_inputs(args.faq, args.texts, args.limit)
+    report = {
+        "toxicity": benchmark("toxicity", load_toxicity_pipeline, lambda model, text: model(text)[0],
+                              texts, toxicity_agreement, backends, args.concurrency, args.batch_wait_ms),
+        "reranker": benchmark("reranker", load_reranker,
+                              lambda model, item: model.rank(item[0], item[1], top_k=TOP_K),
+                              queries, rerank_agreement, backends, args.concurrency, args.batch_wait_ms),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import time
+import html
 import uuid
 import streamlit as st
 from datetime import datetime
@@ -6,10 +6,6 @@ import travel_agency_bot_engine as chatbot
 from PIL import Image
 import memory as db
 
-chatbot_instance = chatbot.TravelAgencyBot()
-db_instance = db.ChatHistoryDB("chat_history.db")
-db_instance.create_table("chat_history")
-
 icon = Image.open('static_files/logo.png')
 # Set page configuration
 st.set_page_config(
@@ -18,6 +14,22 @@ st.set_page_config(
     layout="centered"
 )
 
+# The bot and the database are process-wide singletons shared by all sessions and reruns.
+# Everything that belongs to a single user lives in st.session_state.
+@st.cache_resource(show_spinner="Starting Nomad AI...")
+def get_chatbot():
+    # Returns right away; collections and models warm up on a background thread while the page renders
+    return chatbot.TravelAgencyBot(background=True)
+
+@st.cache_resource(show_spinner=False)
+def get_chat_history_db():
+    db_instance = db.ChatHistoryDB("chat_history.db", write_behind=True)
+    db_instance.create_table("chat_history")
+    return db_instance
+
+chatbot_instance = get_chatbot()
+db_instance = get_chat_history_db()
+
 # Custom CSS for better chat appearance
 st.markdown("""
 <style>
@@ -55,13 +67,13 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# list of created chats (history)
+CHAT_HEADERS_PAGE_SIZE = 20
+TRANSCRIPT_PAGE_SIZE = 20
+
+# list of created chats (history) - only headers, newest first; messages are loaded when a chat is opened
 if "chats" not in st.session_state:
-    history = db_instance.read_all_chats()
-    if history:
-        st.session_state["chats"] = history
-    else:
-        st.session_state["chats"] = []
+    st.session_state["chats"] = db_instance.read_chat_headers(limit=CHAT_HEADERS_PAGE_SIZE)
+    st.session_state["more_chats"] = len(st.session_state["chats"]) == CHAT_HEADERS_PAGE_SIZE
     
     # st.session_state["chats"]  = [
     #    {
@@ -95,17 +107,48 @@ def create_new_chat(default_header="New conversation"):
         "create_date": datetime.now().isoformat(),
         "history": []
     }
-    st.session_state["chats"].append(new_chat)
+    st.session_state["chats"].insert(0, new_chat)
     st.session_state["current_chat"] = new_chat
-
-def chatbot_response(user_input, conversation_id):
-    # Simulate a response from the chatbot
-    chatbot_instance.process_user_input(user_input,st.session_state["current_chat"]["history"])
-    response = {
-        "conversation_id": conversation_id,
-        "response": f"{chatbot_instance.provide_answer()}"
-    }
-    return response
+    st.session_state["visible_messages"] = TRANSCRIPT_PAGE_SIZE
+
+def load_more_chats():
+    # Fetch the next page of headers after the oldest one shown
+    page = db_instance.read_chat_headers(limit=CHAT_HEADERS_PAGE_SIZE, before=st.session_state["chats"][-1])
+    st.session_state["chats"].extend(page)
+    st.session_state["more_chats"] = len(page) == CHAT_HEADERS_PAGE_SIZE
+
+def open_chat(chat):
+    # Chats created in this session may not be stored yet
+    st.session_state["current_chat"] = db_instance.read_chat(chat["conversation_id"]) or chat
+    st.session_state["visible_messages"] = TRANSCRIPT_PAGE_SIZE
+
+def render_message(message):
+    css_class = "user-message" if message["role"] == "human" else "ai-message"
+    content = html.escape(message["content"]).replace("\n", "<br>")
+    return f'<div class="message-container"><div class="{css_class}">{content}</div></div>'
+
+def transcript_html(chat, visible):
+    # Only the last `visible` messages are drawn. Their HTML fragments are cached per conversation,
+    # so a rerun renders just the messages added since the previous one
+    cache = st.session_state.setdefault("rendered_messages", {})
+    if cache.get("conversation_id") != chat["conversation_id"]:
+        cache.clear()
+        cache["conversation_id"] = chat["conversation_id"]
+        cache["fragments"] = {}
+    fragments = cache["fragments"]
+    history = chat.get("history", [])
+    start = max(len(history) - visible, 0)
+    for index in range(start, len(history)):
+        if index not in fragments:
+            fragments[index] = render_message(history[index])
+    return '<div class="chat-messages">' + "".join(fragments[index] for index in range(start, len(history))) + '</div>'
+
+def chatbot_response_stream(user_input, metrics):
+    # Stream answer tokens from the chatbot as they arrive; the summary of older turns is kept with the chat
+    current_chat = st.session_state["current_chat"]
+    return chatbot_instance.stream_user_input(
+        user_input, current_chat["history"], metrics=metrics, summary_state=current_chat.setdefault("summary", {})
+    )
 
 ######################################################################################################
 # Sidebar for chat history and new conversation creation
@@ -119,73 +162,66 @@ with st.sidebar:
     if st.button("Create new conversation"):
         create_new_chat()
     st.header("Chat history")
-    sorted_chats = sorted(st.session_state["chats"], key=lambda x: x["create_date"], reverse=True)
-    for chat in sorted_chats:
+    for chat in st.session_state["chats"]:
         if st.button(f"{chat['header']}", key=chat["conversation_id"]):
-            st.session_state["current_chat"] = chat
+            open_chat(chat)
+            st.rerun()
+    if st.session_state["more_chats"] and st.session_state["chats"]:
+        if st.button("Load more", key="load_more_chats"):
+            load_more_chats()
             st.rerun()
 
 #####################################################################################################
 # Main chat area
 st.title("Your travel assistant - Nomad AI")
 st.write("Hello traveler! I am your travel assistant. How can I help you today?")
+if chatbot_instance.startup_error is not None:
+    st.error(f"Nomad AI failed to start: {chatbot_instance.startup_error}")
+elif not chatbot_instance.ready.is_set():
+    st.info("Nomad AI is warming up. Questions asked now are answered as soon as it is ready.")
+
+if "current_chat" in st.session_state:
+    current_chat = st.session_state["current_chat"]
+    visible = st.session_state.setdefault("visible_messages", TRANSCRIPT_PAGE_SIZE)
+    hidden = len(current_chat.get("history", [])) - visible
+    if hidden > 0 and st.button(f"Load earlier messages ({hidden} more)", key="load_earlier_messages"):
+        visible = st.session_state["visible_messages"] = visible + TRANSCRIPT_PAGE_SIZE
+    st.markdown(transcript_html(current_chat, visible), unsafe_allow_html=True)
+
+# Input for new message
+user_input = st.chat_input("Type your message here...")
+
+if user_input:
+    # A new chat or a first message changes the sidebar header, which was drawn before this point
+    header_changed = "current_chat" not in st.session_state or not st.session_state["current_chat"]["history"]
+    if "current_chat" not in st.session_state:
+        create_new_chat(user_input)
+    else:
+        # Check if the current chat is empty
+        if not st.session_state["current_chat"]["history"]:
+            st.session_state["current_chat"]["header"] = user_input[:30] + "..." if len(user_input) > 30 else user_input
+
+    # Add user message to the display; only the new turn is drawn, the transcript picks it up on the next rerun
+    user_message = {"role": "human", "content": user_input, "create_date": datetime.now().isoformat()}
+    st.session_state["current_chat"]["history"].append(user_message)
+    st.markdown(render_message(user_message), unsafe_allow_html=True)
+
+    # Create a placeholder for the AI's response
+    message_placeholder = st.empty()
+    message_placeholder.markdown("Thinking...")
+
+    # Render tokens as they are streamed from the chatbot
+    metrics = {}
+    full_response = message_placeholder.write_stream(chatbot_response_stream(user_input, metrics))
+
+    # Add AI message to the display, keeping the turn timings with it
+    assistant_message = {"role": "assistant", "content": full_response, "create_date": datetime.now().isoformat(), "metrics": metrics}
+    st.session_state["current_chat"]["history"].append(assistant_message)
+    message_placeholder.markdown(render_message(assistant_message), unsafe_allow_html=True)
+
+    #Save chat history to the database (passing it as a list)
+    db_instance.save_chat_history([st.session_state["current_chat"]])
 
-with st.container():
-    messages_html = '<div class="chat-messages">'
-    if "current_chat" in st.session_state:
-        # Display chat messages
-        if "history" in st.session_state["current_chat"]:
-            for message in st.session_state["current_chat"]["history"]:
-                role = message["role"]
-                content = message["content"]
-
-                with st.container():
-                    if role == "human":
-                        messages_html += f'<div class="message-container"><div class="user-message">{content}</div></div>'
-                    else:
-                        messages_html += f'<div class="message-container"><div class="ai-message">{content}</div></div>'
-
-    st.markdown(messages_html, unsafe_allow_html=True)
-    # Input for new message
-    with st.container():
-        user_input = st.chat_input("Type your message here...")
-
-        if user_input:
-            if "current_chat" not in st.session_state:
-                create_new_chat(user_input)
-            else:
-                # Check if the current chat is empty
-                if not st.session_state["current_chat"]["history"]:
-                    st.session_state["current_chat"]["header"] = user_input[:30] + "..." if len(user_input) > 30 else user_input
-
-            # Add user message to the display
-            st.session_state["current_chat"]["history"].append({"role": "human", "content": user_input, "create_date": datetime.now().isoformat()})
-
-            # Create a placeholder for the AI's response
-            with st.chat_message("assistant"):
-                message_placeholder = st.empty()
-                message_placeholder.markdown("Thinking...")
-
-                # Get response from the chatbot
-                response = chatbot_response(user_input, st.session_state["current_chat"]["conversation_id"])
-
-                # Save the conversation ID
-                st.session_state["current_chat"]["conversation_id"] = response["conversation_id"]
-
-                # Add AI message to the display
-                st.session_state["current_chat"]["history"].append({"role": "assistant", "content": response["response"], "create_date": datetime.now().isoformat()})
-                
-                #Save chat history to the database (passing it as a list)
-                db_instance.save_chat_history([st.session_state["current_chat"]])
-
-                # Display typing effect
-                full_response = response["response"]
-                simulated_response = ""
-
-                for chunk in full_response.split():
-                    simulated_response += chunk + " "
-                    message_placeholder.markdown(simulated_response + "▌")
-                    time.sleep(0.2)
-
-                st.rerun()
+    if header_changed:
+        st.rerun()
 ###################################################################################################################
\ No newline at end of file
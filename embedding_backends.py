@@ -0,0 +1,75 @@
+import os
+import re
+
+from model_registry import LOCAL_EMBEDDING_MODEL, registry
+
+EMBEDDING_BACKEND = os.getenv("NOMAD_EMBEDDING_BACKEND", "openai")
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_BACKENDS = ("openai", "local")
+
+
+class LocalEmbeddingFunction:
+    """
+    Chroma-compatible embedding function running a sentence-transformers model on CPU.
+    The model is shared through the model registry and inputs are encoded in batches.
+    """
+
+    def __init__(self, batch_size=64, model_name=LOCAL_EMBEDDING_MODEL):
+        """
+        Initialize the LocalEmbeddingFunction instance.
+
+        Args:
+            batch_size (int, optional): Number of texts encoded in one forward pass. Defaults to 64.
+            model_name (str, optional): Model the registry's embedder loads. Defaults to NOMAD_LOCAL_EMBEDDING_MODEL.
+        """
+        self.batch_size = batch_size
+        self.model_name = model_name
+
+    def __call__(self, input):
+        model = registry.get("embedder")
+        return list(model.encode(list(input), batch_size=self.batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False))
+
+    def name(self):
+        # Part of the identity of persisted vectors, so a different model does not reuse them
+        return f"nomad-local-{self.model_name}"
+
+
+def embedding_suffix(backend=None):
+    """
+    Return the suffix of the collection names of a backend. Vectors of different backends or models
+    are not comparable, so each gets its own collections, vector indexes and response cache.
+
+    Args:
+        backend (str, optional): 'openai' or 'local'. Defaults to NOMAD_EMBEDDING_BACKEND.
+
+    Returns:
+        str: '' for 'openai', which keeps the original collection names, else e.g. '-local-all-MiniLM-L6-v2'.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "openai":
+        return ""
+    # Chroma collection names allow letters, digits, '.', '_' and '-' and at most 63 characters
+    model = re.sub(r"[^A-Za-z0-9._-]+", "-", LOCAL_EMBEDDING_MODEL.rsplit("/", 1)[-1]).strip("._-")
+    return f"-{backend}-{model}"[:40].rstrip("._-")
+
+
+def create_embedding_function(backend=None, api_key=None):
+    """
+    Create the embedding function for the given backend.
+
+    Args:
+        backend (str, optional): 'openai' (text-embedding-ada-002 over the network) or 'local'
+            (sentence-transformers on CPU). Defaults to NOMAD_EMBEDDING_BACKEND.
+        api_key (str, optional): OpenAI API key for the 'openai' backend.
+
+    Returns:
+        callable: Chroma-compatible embedding function.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "openai":
+        from chromadb.utils import embedding_functions
+        return embedding_functions.OpenAIEmbeddingFunction(model_name=OPENAI_EMBEDDING_MODEL, api_key=api_key)
+    if backend == "local":
+        return LocalEmbeddingFunction()
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
@@ -0,0 +1,370 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from instrumentation import telemetry
+
+INFERENCE_BACKEND = os.getenv("NOMAD_INFERENCE_BACKEND", "torch")
+ONNX_DIR = os.getenv("NOMAD_ONNX_DIR", "onnx_models")
+BATCH_WAIT_MS = float(os.getenv("NOMAD_BATCH_WAIT_MS", "0"))
+MAX_BATCH_SIZE = int(os.getenv("NOMAD_MAX_BATCH_SIZE", "16"))
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+BATCH_SIZES = telemetry.histogram("nomad_inference_batch_size", "Requests grouped into one forward pass.",
+                                  buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+class MicroBatcher:
+    """
+    Groups requests from concurrent threads into batches processed by a single worker thread.
+    A batch is closed once it holds max_batch_size requests or max_wait seconds after its
+    first request arrived, whichever comes first.
+    """
+
+    def __init__(self, process_batch, max_batch_size=MAX_BATCH_SIZE, max_wait=0.005, name="micro-batcher"):
+        """
+        Initialize the MicroBatcher instance.
+
+        Args:
+            process_batch (callable): Function taking a list of requests and returning a list of results
+                in the same order.
+            max_batch_size (int, optional): Maximum number of requests per batch.
+            max_wait (float, optional): Seconds the first request of a batch waits for others. Defaults to 0.005.
+            name (str, optional): Name of the worker thread.
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, request):
+        """
+        Queue a request and return a Future resolved with its result.
+        """
+        future = Future()
+        self._queue.put((request, future))
+        return future
+
+    def __call__(self, request):
+        return self.submit(request).result()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            BATCH_SIZES.observe(len(batch))
+            try:
+                results = self.process_batch([request for request, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+
+def rank_documents(predict, query, documents, return_documents=False, top_k=None):
+    """
+    Score (query, document) pairs and sort them like CrossEncoder.rank.
+
+    Returns:
+        list of dict: Entries with 'corpus_id', 'score' and optionally 'text', best first.
+    """
+    scores = predict([(query, document) for document in documents])
+    ranked = []
+    for corpus_id, score in enumerate(scores):
+        entry = {"corpus_id": corpus_id, "score": float(score)}
+        if return_documents:
+            entry["text"] = documents[corpus_id]
+        ranked.append(entry)
+    ranked.sort(key=lambda entry: entry["score"], reverse=True)
+    return ranked[:top_k]
+
+
+def encode_pairs(tokenizer, query, documents, max_length=512):
+    """
+    Build padded cross-encoder inputs for one query and documents that are already tokenized.
+    Only the query is tokenized here; documents are truncated to fit max_length.
+
+    Args:
+        tokenizer: Hugging Face tokenizer of the cross-encoder.
+        query (str): Query text.
+        documents (list of list of int): Token ids of each document, without special tokens.
+        max_length (int, optional): Maximum length of a (query, document) input. Defaults to 512.
+
+    Returns:
+        dict: NumPy arrays named after tokenizer.model_input_names, one row per document.
+    """
+    query_ids = tokenizer(query, add_special_tokens=False, truncation=True, max_length=max_length // 2)["input_ids"]
+    budget = max(0, max_length - len(query_ids) - tokenizer.num_special_tokens_to_add(pair=True))
+    rows = []
+    for document_ids in documents:
+        input_ids = tokenizer.build_inputs_with_special_tokens(query_ids, document_ids[:budget])
+        token_type_ids = tokenizer.create_token_type_ids_from_sequences(query_ids, document_ids[:budget])
+        rows.append((input_ids, token_type_ids))
+    width = max((len(input_ids) for input_ids, _ in rows), default=0)
+    features = {
+        "input_ids": np.full((len(rows), width), tokenizer.pad_token_id or 0, dtype=np.int64),
+        "attention_mask": np.zeros((len(rows), width), dtype=np.int64),
+        "token_type_ids": np.zeros((len(rows), width), dtype=np.int64),
+    }
+    for row, (input_ids, token_type_ids) in enumerate(rows):
+        features["input_ids"][row, :len(input_ids)] = input_ids
+        features["attention_mask"][row, :len(input_ids)] = 1
+        features["token_type_ids"][row, :len(token_type_ids)] = token_type_ids
+    return {name: features[name] for name in tokenizer.model_input_names if name in features}
+
+
+def encoded_pair_scorer(model):
+    """
+    Expose what is needed to score pre-tokenized pairs with a reranker.
+
+    Returns:
+        tuple or None: (tokenizer, max_length, score) where score takes the output of encode_pairs and
+            returns one score per row, or None when the model hides its tokenizer (e.g. behind the
+            micro-batching queue) and has to be called with texts.
+    """
+    if isinstance(model, OnnxCrossEncoder):
+        return model.classifier.tokenizer, model.classifier.max_length, model.predict_encoded
+    if hasattr(model, "tokenizer") and hasattr(model, "model"):
+        # sentence_transformers.CrossEncoder
+        import torch
+
+        activation = (getattr(model, "activation_fn", None) or getattr(model, "activation_fct", None)
+                      or getattr(model, "default_activation_function", None))
+
+        def score(features):
+            device = next(model.model.parameters()).device
+            with torch.no_grad():
+                logits = model.model(**{name: torch.from_numpy(value).to(device) for name, value in features.items()}).logits
+                scores = (activation(logits) if activation is not None else logits).float().cpu().numpy()
+            return scores[:, 0] if scores.shape[1] == 1 else scores
+
+        return model.tokenizer, min(model.max_length or 512, 512), score
+    return None
+
+
+class BatchedCrossEncoder:
+    """
+    Wraps a cross-encoder so the pairs of concurrent rank() calls are scored in one forward pass.
+    """
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait=0.005):
+        self.model = model
+        # Each request is the list of pairs of one call; batches are limited by calls, not pairs
+        self.batcher = MicroBatcher(self._predict_batch, max_batch_size, max_wait, name="reranker-batcher")
+
+    def _predict_batch(self, requests):
+        pairs = [pair for request in requests for pair in request]
+        scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        results = []
+        start = 0
+        for request in requests:
+            results.append(scores[start:start + len(request)])
+            start += len(request)
+        return results
+
+    def predict(self, pairs, **kwargs):
+        return self.batcher(list(pairs))
+
+    def rank(self, query, documents, return_documents=False, top_k=None, **kwargs):
+        return rank_documents(self.predict, query, documents, return_documents, top_k)
+
+
+class BatchedTextClassifier:
+    """
+    Wraps a text-classification pipeline so single texts from concurrent callers are classified together.
+    Lists are passed straight to the pipeline, which already batches them.
+    """
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait=0.005):
+        self.model = model
+        self.batcher = MicroBatcher(lambda texts: self.model(texts, batch_size=len(texts)),
+                                    max_batch_size, max_wait, name="toxicity-batcher")
+
+    def __call__(self, inputs, **kwargs):
+        if isinstance(inputs, str):
+            return [self.batcher(inputs)]
+        return self.model(list(inputs), **kwargs)
+
+
+class OnnxSequenceClassifier:
+    """
+    A sequence classification model exported to ONNX and run with ONNX Runtime on CPU.
+    """
+
+    def __init__(self, model_dir, file_name="model.onnx", max_length=512, threads=None):
+        """
+        Initialize the OnnxSequenceClassifier instance.
+
+        Args:
+            model_dir (str): Directory created by export_onnx.
+            file_name (str, optional): ONNX file to load, e.g. 'model_int8.onnx'. Defaults to 'model.onnx'.
+            max_length (int, optional): Inputs are truncated to this many tokens. Defaults to 512.
+            threads (int, optional): Intra-op threads. Defaults to ONNX Runtime's choice.
+        """
+        import onnxruntime
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.id2label = AutoConfig.from_pretrained(model_dir).id2label
+        self.max_length = max_length
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        path = os.path.join(model_dir, file_name)
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.memory_bytes = sum(os.path.getsize(name) for name in (path, path + ".data") if os.path.exists(name))
+
+    def logits(self, texts, text_pairs=None):
+        """
+        Run the model on a batch of texts (or text pairs) and return the raw logits.
+        """
+        encoded = self.tokenizer(texts, text_pairs, padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+        return self.run(encoded)
+
+    def run(self, encoded):
+        """
+        Run the model on already tokenized inputs and return the raw logits.
+        """
+        feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+class OnnxCrossEncoder:
+    """
+    Cross-encoder reranker backed by ONNX Runtime, with the predict() and rank() interface of CrossEncoder.
+    Scores of single-logit models go through a sigmoid, as CrossEncoder does by default.
+    """
+
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.memory_bytes = classifier.memory_bytes
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        pairs = list(pairs)
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            logits = self.classifier.logits([pair[0] for pair in batch], [pair[1] for pair in batch])
+            scores.append(self._activation(logits))
+        return np.concatenate(scores) if scores else np.zeros(0)
+
+    def predict_encoded(self, features):
+        """
+        Score pairs tokenized by encode_pairs.
+        """
+        return self._activation(self.classifier.run(features))
+
+    @staticmethod
+    def _activation(logits):
+        return 1 / (1 + np.exp(-logits[:, 0])) if logits.shape[1] == 1 else logits
+
+    def rank(self, query, documents, return_documents=False, top_k=None, **kwargs):
+        return rank_documents(self.predict, query, documents, return_documents, top_k)
+
+
+class OnnxTextClassifier:
+    """
+    Text classifier backed by ONNX Runtime, returning [{'label', 'score'}] like a transformers pipeline.
+    """
+
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.memory_bytes = classifier.memory_bytes
+
+    def __call__(self, inputs, batch_size=32, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        results = []
+        for start in range(0, len(texts), batch_size):
+            logits = self.classifier.logits(texts[start:start + batch_size])
+            probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            for row in probabilities:
+                label = int(row.argmax())
+                results.append({"label": self.classifier.id2label[label], "score": float(row[label])})
+        return results
+
+
+def export_onnx(model_name, out_dir, quantize=True):
+    """
+    Export a Hugging Face sequence classification model to ONNX and optionally add an
+    int8 dynamically quantised copy next to it.
+
+    Args:
+        model_name (str): Hugging Face model id.
+        out_dir (str): Directory receiving model.onnx, model_int8.onnx, the tokenizer and the config.
+        quantize (bool, optional): Also write model_int8.onnx. Defaults to True.
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).logits
+
+    sample = tokenizer(["sample query", "another query"], ["sample document", "a longer sample document"],
+                       padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    os.makedirs(out_dir, exist_ok=True)
+    model_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsOnly(model),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names}, "logits": {0: "batch"}},
+            opset_version=17,
+        )
+    tokenizer.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        # Large models (e.g. XLM-R large) exceed the 2 GB protobuf limit, so weights are kept in a separate file
+        quantize_dynamic(model_path, os.path.join(out_dir, "model_int8.onnx"),
+                         weight_type=QuantType.QInt8, use_external_data_format=True)
+
+
+def load_onnx_classifier(model_name, quantized=True):
+    """
+    Load the ONNX export of a model, exporting it to ONNX_DIR on first use.
+
+    Args:
+        model_name (str): Hugging Face model id.
+        quantized (bool, optional): Load the int8 model instead of the fp32 one. Defaults to True.
+
+    Returns:
+        OnnxSequenceClassifier: The loaded model.
+    """
+    model_dir = os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+    file_name = "model_int8.onnx" if quantized else "model.onnx"
+    if not os.path.exists(os.path.join(model_dir, file_name)):
+        export_onnx(model_name, model_dir, quantize=quantized)
+    return OnnxSequenceClassifier(model_dir, file_name)
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+
+def content_hash(document, metadata):
+    """
+    Compute a stable hash of a document and its metadata.
+
+    Args:
+        document (str): Text stored in the collection.
+        metadata (dict): Metadata stored alongside the document.
+
+    Returns:
+        str: Hex digest identifying the row content.
+    """
+    payload = json.dumps({"document": document, "metadata": metadata}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    A class to keep track of which rows have already been embedded into each Chroma collection.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the IngestManifest instance.
+
+        Args:
+            path (str): Path to the JSON manifest file.
+        """
+        self.path = path
+        self.collections = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.collections = json.load(f)
+
+    def get(self, collection_name):
+        """
+        Return the stored mapping of row id to content hash, or None if the collection was never ingested.
+        """
+        return self.collections.get(collection_name)
+
+    def diff(self, collection_name, hashes, existing_ids=None):
+        """
+        Compare current rows against the manifest.
+
+        Args:
+            collection_name (str): Name of the Chroma collection.
+            hashes (dict): Mapping of row id to content hash for the current data.
+            existing_ids (list of str, optional): Ids present in the collection. Used instead of
+                the manifest when the manifest does not describe the collection.
+
+        Returns:
+            tuple: (ids to upsert, ids to delete)
+        """
+        previous = self.get(collection_name)
+        if previous is None:
+            previous = dict.fromkeys(existing_ids or [])
+        changed = [row_id for row_id, digest in hashes.items() if previous.get(row_id) != digest]
+        removed = [row_id for row_id in previous if row_id not in hashes]
+        return changed, removed
+
+    def update(self, collection_name, hashes):
+        """
+        Record the current content hashes of a collection and persist the manifest.
+        """
+        self.collections[collection_name] = dict(hashes)
+        self.save()
+
+    def save(self):
+        """
+        Write the manifest atomically so an interrupted save never leaves a partial file.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.collections, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
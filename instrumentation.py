@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    def __init__(self, telemetry, name, help_text):
+        self.telemetry = telemetry
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not self.telemetry.enabled:
+            return
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {_format_labels(key) or "total": value for key, value in self.values.items()}
+
+
+class Histogram:
+    """
+    Distribution of observed values (seconds for latencies) in cumulative buckets.
+    """
+
+    def __init__(self, telemetry, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.telemetry = telemetry
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not self.telemetry.enabled:
+            return
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                # Per-bucket counts plus one overflow slot, then sum and count
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                _format_labels(key) or "total": {"count": count, "sum": total, "mean": total / count if count else 0.0}
+                for key, (_, total, count) in self.series.items()
+            }
+
+
+class Span:
+    """
+    Times a block of code. On exit the duration is added to the span histogram and,
+    if a JSON log is configured, written as one JSON line.
+    """
+
+    __slots__ = ("telemetry", "name", "attributes", "start")
+
+    def __init__(self, telemetry, name, attributes):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        self.telemetry.span_seconds.observe(duration, span=self.name)
+        if exc_type is not None:
+            self.telemetry.span_errors.inc(span=self.name)
+        if self.telemetry.json_log is not None:
+            self.telemetry.json_log.info(json.dumps({
+                "ts": time.time(),
+                "span": self.name,
+                "duration_ms": duration * 1000,
+                "thread": threading.current_thread().name,
+                "error": exc_type.__name__ if exc_type is not None else None,
+                **self.attributes,
+            }, default=str))
+        return False
+
+
+class _NoopSpan:
+    """
+    Span returned while telemetry is disabled; entering and leaving it costs almost nothing.
+    """
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Telemetry:
+    """
+    A process-wide registry of counters, histograms and spans, exported as Prometheus text
+    and optionally as a JSON-lines log of spans.
+    """
+
+    def __init__(self, enabled=True, json_log_path=None):
+        """
+        Initialize the Telemetry instance.
+
+        Args:
+            enabled (bool, optional): Record metrics and spans. When False every call is a no-op. Defaults to True.
+            json_log_path (str, optional): File each finished span is appended to as a JSON line.
+        """
+        self.enabled = enabled
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.json_log = None
+        if json_log_path:
+            self.json_log = logging.getLogger("nomad.trace")
+            self.json_log.setLevel(logging.INFO)
+            self.json_log.propagate = False
+            handler = logging.FileHandler(json_log_path, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.json_log.addHandler(handler)
+        self.span_seconds = self.histogram("nomad_span_seconds", "Duration of instrumented code blocks.")
+        self.span_errors = self.counter("nomad_span_errors_total", "Instrumented code blocks that raised.")
+
+    def _register(self, cls, name, *args):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(self, name, *args)
+            return self.metrics[name]
+
+    def counter(self, name, help_text):
+        """
+        Return the counter registered under name, creating it on first use.
+        """
+        return self._register(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        """
+        Return the histogram registered under name, creating it on first use.
+        """
+        return self._register(Histogram, name, help_text, buckets)
+
+    def span(self, name, **attributes):
+        """
+        Context manager timing the enclosed block.
+
+        Args:
+            name (str): Span name, used as the 'span' label of nomad_span_seconds.
+            **attributes: Extra fields written to the JSON log.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def render_prometheus(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def snapshot(self):
+        """
+        Return all metrics as a JSON-serialisable dict.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+telemetry = Telemetry(
+    enabled=os.getenv("NOMAD_TELEMETRY", "1") != "0",
+    json_log_path=os.getenv("NOMAD_TRACE_LOG"),
+)
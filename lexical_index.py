@@ -0,0 +1,122 @@
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from query_filters import metadata_matches
+
+STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from how i in is it me my of on or the to what when where which
+    who will with you your
+""".split())
+
+
+def tokenize(text):
+    """
+    Split text into lower-case word tokens without stopwords.
+    """
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    An in-process BM25 inverted index over the same documents as a Chroma collection.
+    Per-term document weights are precomputed, so a query only sums a few sparse arrays.
+    """
+
+    def __init__(self, ids, documents, metadatas=None, k1=1.5, b=0.75):
+        """
+        Initialize the BM25Index instance.
+
+        Args:
+            ids (list of str): Document ids, the same as in the Chroma collection.
+            documents (list of str): Document texts.
+            metadatas (list of dict, optional): Document metadata returned with the results.
+            k1 (float, optional): Term frequency saturation. Defaults to 1.5.
+            b (float, optional): Document length normalisation. Defaults to 0.75.
+        """
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas) if metadatas is not None else [{} for _ in self.ids]
+
+        postings = defaultdict(list)
+        lengths = np.zeros(len(self.documents), dtype=np.float32)
+        for position, document in enumerate(self.documents):
+            counts = Counter(tokenize(document))
+            lengths[position] = sum(counts.values())
+            for term, count in counts.items():
+                postings[term].append((position, count))
+
+        average_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        norms = k1 * (1 - b + b * lengths / average_length)
+        total = len(self.documents)
+        # term -> (document positions, BM25 weight of the term in each of them)
+        self.postings = {}
+        for term, entries in postings.items():
+            positions = np.array([position for position, _ in entries], dtype=np.int32)
+            frequencies = np.array([count for _, count in entries], dtype=np.float32)
+            idf = np.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[term] = (positions, idf * frequencies * (k1 + 1) / (frequencies + norms[positions]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, n=5, where=None):
+        """
+        Return the n best matching documents for the query.
+
+        Args:
+            query (str): Query text.
+            n (int, optional): Number of results. Defaults to 5.
+            where (dict, optional): Chroma where filter the metadata of the results must match.
+
+        Returns:
+            dict: Results in the format of a Chroma query for one query text, with keys 'ids',
+                'documents', 'metadatas' and 'distances' (negated BM25 scores, lower is better).
+        """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                positions, weights = self.postings[term]
+                scores[positions] += weights
+        matched = np.flatnonzero(scores)
+        if where:
+            matched = np.array([i for i in matched if metadata_matches(self.metadatas[i], where)], dtype=np.int64)
+        if len(matched) > n:
+            matched = matched[np.argpartition(-scores[matched], n - 1)[:n]]
+        best = matched[np.argsort(-scores[matched], kind="stable")]
+        return {
+            "ids": [[self.ids[i] for i in best]],
+            "documents": [[self.documents[i] for i in best]],
+            "metadatas": [[self.metadatas[i] for i in best]],
+            "distances": [[-float(scores[i]) for i in best]],
+        }
+
+
+def reciprocal_rank_fusion(results, n=5, k=60):
+    """
+    Merge several Chroma-style result sets with reciprocal rank fusion: every document scores
+    the sum of 1 / (k + rank) over the result sets it appears in.
+
+    Args:
+        results (list of dict): Results for one query each, in the format of a Chroma query.
+        n (int, optional): Number of fused results. Defaults to 5.
+        k (int, optional): Damping constant; larger values flatten the rank weights. Defaults to 60.
+
+    Returns:
+        dict: Fused results in the same format, with 'distances' holding negated fusion scores.
+    """
+    scores = {}
+    entries = {}
+    for result in results:
+        metadatas = (result.get("metadatas") or [None])[0] or [{} for _ in result["ids"][0]]
+        for rank, (doc_id, document, metadata) in enumerate(zip(result["ids"][0], result["documents"][0], metadatas)):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+            entries.setdefault(doc_id, (document, metadata))
+    best = sorted(scores, key=scores.get, reverse=True)[:n]
+    return {
+        "ids": [best],
+        "documents": [[entries[doc_id][0] for doc_id in best]],
+        "metadatas": [[entries[doc_id][1] for doc_id in best]],
+        "distances": [[-scores[doc_id] for doc_id in best]],
+    }
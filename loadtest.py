@@ -0,0 +1,256 @@
+"""
+Replay a JSONL file of user turns through TravelAgencyBot and report latency, throughput and cache hit rates.
+
+Each line is a JSON object with the user message in one of the fields 'message', 'text',
+'question', 'body' or 'title'. Lines sharing a 'conversation_id' are replayed in order as one
+conversation; every other line is a conversation of its own.
+
+The report also covers the adaptive rerank: the share of candidates scored and how often its
+selection agreed with a full rerank. Run with NOMAD_ADAPTIVE_RERANK=0 for the full-rerank baseline.
+
+    python loadtest.py turns.jsonl --concurrency 8 --output report.json
+    python loadtest.py turns.jsonl --offline --baseline report.json
+"""
+import argparse
+import hashlib
+import json
+import re
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+MESSAGE_FIELDS = ("message", "text", "question", "body", "title")
+LATENCY_KEYS = ("total_time", "time_to_first_token")
+
+
+class OfflineEmbeddingFunction:
+    """
+    Deterministic bag-of-words embedding (hashing trick) used instead of the OpenAI embeddings offline.
+    """
+
+    def __init__(self, dimensions=384):
+        self.dimensions = dimensions
+
+    def __call__(self, input):
+        embeddings = []
+        for text in input:
+            vector = np.zeros(self.dimensions, dtype=np.float32)
+            for token in re.findall(r"\w+", text.lower()):
+                bucket = int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:4], "little")
+                vector[bucket % self.dimensions] += 1.0
+            norm = np.linalg.norm(vector)
+            embeddings.append(vector / norm if norm else vector)
+        return embeddings
+
+    @staticmethod
+    def name():
+        return "offline-hashing"
+
+
+class OfflineChatCompletions:
+    """
+    Stand-in for client.chat.completions answering with a short canned text, streamed word by word.
+    """
+
+    def __init__(self, first_token_latency=0.0):
+        self.first_token_latency = first_token_latency
+
+    def create(self, model, messages, stream=False, **kwargs):
+        question = messages[-1]["content"] or ""
+        answer = f"Offline answer to: {question[:80]}"
+        time.sleep(self.first_token_latency)
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+        return (
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " ", tool_calls=None))])
+            for word in answer.split()
+        )
+
+
+class OfflineClient:
+    """
+    Minimal OpenAI client replacement for offline runs.
+    """
+
+    def __init__(self, first_token_latency=0.0):
+        self.chat = SimpleNamespace(completions=OfflineChatCompletions(first_token_latency))
+
+
+def load_conversations(path, limit=None):
+    """
+    Read turns from a JSONL file and group them into conversations.
+
+    Returns:
+        list of list of str: Messages of each conversation, in order.
+    """
+    conversations = OrderedDict()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            message = next((record[field] for field in MESSAGE_FIELDS if record.get(field)), None)
+            if message is None:
+                continue
+            key = record.get("conversation_id", f"line-{line_number}")
+            conversations.setdefault(key, []).append(message)
+            if limit and sum(len(turns) for turns in conversations.values()) >= limit:
+                break
+    return list(conversations.values())
+
+
+def percentiles(values):
+    """
+    Summarise latencies in milliseconds.
+    """
+    if not values:
+        return {"count": 0}
+    array = np.array(values) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": float(array.mean()),
+        "p50_ms": float(np.percentile(array, 50)),
+        "p95_ms": float(np.percentile(array, 95)),
+        "p99_ms": float(np.percentile(array, 99)),
+    }
+
+
+def replay_conversation(bot, messages):
+    """
+    Run the turns of one conversation sequentially, the way the chat UI does.
+
+    Returns:
+        list of dict: Metrics of every turn, with 'error' set if the turn failed.
+    """
+    history = []
+    summary_state = {}
+    results = []
+    for message in messages:
+        history.append({"role": "human", "content": message, "create_date": datetime.now().isoformat()})
+        metrics = {}
+        try:
+            answer = "".join(bot.stream_user_input(message, history, metrics=metrics, summary_state=summary_state))
+        except Exception as e:
+            metrics["error"] = repr(e)
+            answer = ""
+        history.append({"role": "assistant", "content": answer, "create_date": datetime.now().isoformat()})
+        results.append(metrics)
+    return results
+
+
+def build_report(turn_metrics, wall_time, bot, config):
+    """
+    Aggregate per-turn metrics into the JSON report.
+    """
+    latencies = {key: [m[key] for m in turn_metrics if key in m] for key in LATENCY_KEYS}
+    stage_names = sorted({stage for m in turn_metrics for stage in m.get("stages", {})})
+    for stage in stage_names:
+        latencies[f"stage.{stage}"] = [m["stages"][stage] for m in turn_metrics if stage in m.get("stages", {})]
+
+    return {
+        "config": config,
+        "turns": len(turn_metrics),
+        "errors": sum(1 for m in turn_metrics if "error" in m),
+        "wall_time_s": wall_time,
+        "throughput_turns_per_s": len(turn_metrics) / wall_time if wall_time else 0.0,
+        "latency": {key: percentiles(values) for key, values in latencies.items()},
+        "sources": dict(Counter(m.get("source", "error") for m in turn_metrics)),
+        "caches": {
+            "query_embedding": bot.query_embedder.cache.stats(),
+            "response": bot.response_cache.stats(),
+        },
+        "embedding_calls": bot.query_embedder.embedding_calls,
+        "toxicity": bot.toxicity_analyzer.stats() if bot.toxicity_analyzer is not None else None,
+        "reranking": bot.reranker.stats(),
+        "rerank_decisions": dict(Counter(m["rerank"]["decision"] for m in turn_metrics if m.get("rerank"))),
+    }
+
+
+def print_comparison(report, baseline):
+    """
+    Print p50/p95 of every latency in the report next to the baseline run.
+    """
+    print(f"{'metric':<28}{'p50 ms':>10}{'base':>10}{'p95 ms':>10}{'base':>10}")
+    for key, current in report["latency"].items():
+        previous = baseline.get("latency", {}).get(key, {})
+        if not current.get("count"):
+            continue
+        print(f"{key:<28}{current['p50_ms']:>10.1f}{previous.get('p50_ms', float('nan')):>10.1f}"
+              f"{current['p95_ms']:>10.1f}{previous.get('p95_ms', float('nan')):>10.1f}")
+    print(f"{'throughput turns/s':<28}{report['throughput_turns_per_s']:>10.2f}"
+          f"{baseline.get('throughput_turns_per_s', float('nan')):>10.2f}")
+    # Quality of the adaptive rerank, measured against a full rerank on exploration turns
+    reranking, previous = report.get("reranking") or {}, baseline.get("reranking") or {}
+    for key in ("top1", "recall"):
+        current = reranking.get("agreement", {}).get(key)
+        before = previous.get("agreement", {}).get(key)
+        print(f"{'rerank agreement ' + key:<28}{current if current is not None else float('nan'):>10.2f}"
+              f"{before if before is not None else float('nan'):>10.2f}")
+    print(f"{'rerank pairs scored':<28}{reranking.get('scored_ratio', float('nan')):>10.2f}"
+          f"{previous.get('scored_ratio', float('nan')):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay user turns through TravelAgencyBot and report latency.")
+    parser.add_argument("input", help="JSONL file with one user turn per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="Conversations replayed in parallel")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of turns to replay")
+    parser.add_argument("--offline", action="store_true", help="Use local stubs instead of the OpenAI API")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds before the offline stub answers")
+    parser.add_argument("--retrieval-mode", default="hybrid", choices=["hybrid", "vector", "lexical"])
+    parser.add_argument("--embedding-backend", default=None, choices=["openai", "local"],
+                        help="Embedding backend for online runs (defaults to NOMAD_EMBEDDING_BACKEND)")
+    parser.add_argument("--vector-index", default=None, choices=["chroma", "numpy", "hnsw"],
+                        help="Vector search backend (defaults to NOMAD_VECTOR_INDEX)")
+    parser.add_argument("--chroma-path", default=None, help="Chroma directory (defaults to chroma_db, or chroma_db_offline with --offline)")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    parser.add_argument("--baseline", default=None, help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    import travel_agency_bot_engine as chatbot
+
+    conversations = load_conversations(args.input, args.limit)
+    if args.offline:
+        bot = chatbot.TravelAgencyBot(
+            client=OfflineClient(args.stub_latency),
+            embedding_function=OfflineEmbeddingFunction(),
+            chroma_db_path=args.chroma_path or "chroma_db_offline",
+            retrieval_mode=args.retrieval_mode,
+            vector_index=args.vector_index,
+        )
+    else:
+        bot = chatbot.TravelAgencyBot(chroma_db_path=args.chroma_path or "chroma_db", retrieval_mode=args.retrieval_mode,
+                                      embedding_backend=args.embedding_backend, vector_index=args.vector_index)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        turn_metrics = [m for results in executor.map(lambda turns: replay_conversation(bot, turns), conversations) for m in results]
+    wall_time = time.perf_counter() - start
+
+    config = {
+        "input": args.input,
+        "concurrency": args.concurrency,
+        "offline": args.offline,
+        "retrieval_mode": args.retrieval_mode,
+        "embedding_backend": bot.embedding_backend,
+        "vector_index": bot.vector_index,
+        "conversations": len(conversations),
+        "started_at": datetime.now().isoformat(),
+    }
+    report = build_report(turn_metrics, wall_time, bot, config)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
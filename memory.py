@@ -1,108 +1,445 @@
 from datetime import datetime
+import queue
 import sqlite3
+import threading
+import time
 import uuid
+import weakref
 import json
 
+from instrumentation import telemetry
+
+SCHEMA_VERSION = 1
+MESSAGE_FIELDS = ("role", "content", "create_date")
+
+WRITE_ERRORS = telemetry.counter("nomad_chat_history_write_errors_total", "Queued conversation saves that failed, by outcome.")
+
+
+class _ThreadConnection:
+    """
+    Connection and cursor of one thread. Held only by the thread's local storage, so it is
+    collected, and the connection closed, when the thread exits.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.finalizer = weakref.finalize(self, conn.close)
+
+
 class ChatHistoryDB:
     """
     A class to handle saving and managing chatbot history in an SQLite database.
+
+    Conversations and their messages are stored in separate tables. Messages are
+    only ever appended, so saving a conversation costs O(new messages).
+
+    Every thread gets its own connection to the database, which runs in WAL mode so
+    readers never block the writer. With write_behind enabled, saves are queued and
+    written by a background thread in batched transactions.
     """
 
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, write_behind=False, flush_interval=0.5, busy_timeout_ms=5000, max_batch_size=100,
+                 max_write_attempts=3):
         """
         Initialize the ChatHistoryDB instance.
 
         Args:
             db_path (str): Path to the SQLite database file.
+            write_behind (bool, optional): Queue saves and write them from a background thread.
+                Defaults to False.
+            flush_interval (float, optional): Seconds after the first queued save at which the writer
+                commits the saves queued so far in one transaction. Defaults to 0.5.
+            busy_timeout_ms (int, optional): How long a connection waits for a lock before
+                raising "database is locked". Defaults to 5000.
+            max_batch_size (int, optional): Saves after which a transaction is committed early. Defaults to 100.
+            max_write_attempts (int, optional): Batches a queued conversation that failed to write is retried
+                with before it is given up. Defaults to 3.
         """
         self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path)
+        self.busy_timeout_ms = busy_timeout_ms
         self.table_name = None
-        self.cursor = self.conn.cursor()
+        self._local = threading.local()
+        # Open connections of live threads; entries disappear when their thread exits
+        self._connections = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self.last_write_error = None
+        # Set by the writer when a queued save fails, raised by the next flush()
+        self._unreported_error = None
+        # Conversation id -> (latest snapshot, failed attempts) of queued saves not written yet
+        self._retries = {}
+        self.max_write_attempts = max_write_attempts
+        # Saves are numbered when queued; reads wait until the writer has committed up to their number
+        self._queued_seq = 0
+        self._written_seq = 0
+        self._written = threading.Condition()
+        if write_behind:
+            self.flush_interval = flush_interval
+            self.max_batch_size = max_batch_size
+            self._queue = queue.Queue()
+            self._writer = threading.Thread(target=self._write_loop, name="chat-history-writer", daemon=True)
+            self._writer.start()
+
+    def _connect(self):
+        """
+        Open a connection for the current thread with WAL and tuned pragmas.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        # With WAL, NORMAL only syncs at checkpoints and is still safe against corruption
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -8000")
+        return conn
+
+    def _thread_state(self):
+        """
+        Return the calling thread's connection state, opening the connection on first use.
+        Streamlit runs every rerun on a new thread, so connections must not outlive their thread.
+        """
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = self._local.state = _ThreadConnection(self._connect())
+            with self._connections_lock:
+                self._connections.add(state)
+        return state
+
+    @property
+    def conn(self):
+        """
+        Connection owned by the calling thread.
+        """
+        return self._thread_state().conn
+
+    @property
+    def cursor(self):
+        """
+        Cursor of the calling thread's connection.
+        """
+        return self._thread_state().cursor
 
     def create_table(self, table_name):
         """
-        Create a table for storing chat history if it doesn't exist.
+        Create the conversations and messages tables if they don't exist and migrate
+        conversations stored in the legacy single-table format.
 
         Args:
-            table_name (str): Name of the table to store chat history.
+            table_name (str): Name of the legacy table storing whole conversations as JSON.
         """
-        self.cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS {table_name} (
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 uuid TEXT NOT NULL,
+                header TEXT NOT NULL,
                 create_date TEXT NOT NULL,
-                full_body TEXT NOT NULL
+                summary TEXT,
+                message_count INTEGER NOT NULL DEFAULT 0
             )
         """)
+        self.cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_conversations_uuid ON conversations (uuid)")
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_create_date ON conversations (create_date, uuid)")
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id INTEGER NOT NULL REFERENCES conversations (id),
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                create_date TEXT NOT NULL,
+                extra TEXT
+            )
+        """)
+        self.cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_conversation_seq ON messages (conversation_id, seq)")
         self.conn.commit()
         self.table_name = table_name
+        self._migrate_legacy_table(table_name)
+
+    def _migrate_legacy_table(self, table_name):
+        """
+        Copy conversations from the legacy table (one JSON blob per conversation) into the
+        normalised tables. Runs once; the legacy table is left untouched.
+
+        Args:
+            table_name (str): Name of the legacy table.
+        """
+        self.cursor.execute("PRAGMA user_version")
+        if self.cursor.fetchone()[0] >= SCHEMA_VERSION:
+            return
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+        if self.cursor.fetchone():
+            self.cursor.execute(f"SELECT full_body FROM {table_name} ORDER BY id")
+            legacy_chats = [json.loads(row[0]) for row in self.cursor.fetchall()]
+            self._save_chats(legacy_chats)
+        self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
 
     def save_chat_history(self, chat_history):
         """
-        Save chatbot history into the specified table.
+        Save chatbot history. Conversations are upserted and only messages that are not
+        stored yet are inserted.
 
         Args:
-            chat_history (list of dict): List of chat messages as dictionaries with keys 'uuid', 'create_date', and 'full_body'.
+            chat_history (list of dict): List of conversations as dictionaries with keys 'conversation_id',
+                'header', 'create_date', 'history' and optionally 'summary'.
+        """
+        with telemetry.span("save_chat_history", conversations=len(chat_history), write_behind=self._queue is not None):
+            # Without a live writer queued saves would never be written, so they are written right away
+            if self._queue is not None and self._writer is not None and self._writer.is_alive():
+                # Snapshot the conversations, the caller keeps mutating them after this returns
+                snapshot = [
+                    dict(chat, history=list(chat.get("history", [])), summary=dict(chat.get("summary") or {}))
+                    for chat in chat_history
+                ]
+                with self._written:
+                    self._queued_seq += 1
+                    self._queue.put((self._queued_seq, snapshot))
+                return
+            try:
+                self._save_chats(chat_history)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def _write_loop(self):
+        """
+        Background writer: commit the saves queued within flush_interval of the first one, or
+        max_batch_size saves, whichever comes first, in one transaction.
+        """
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            saves = [item for item in batch if item is not None]
+            try:
+                self._write_batch([chat for _, snapshot in saves for chat in snapshot])
+            except Exception as e:
+                # Whatever goes wrong, the writer must stay alive or every later save is lost
+                self._report_write_error(e)
+            finally:
+                if saves:
+                    with self._written:
+                        self._written_seq = saves[-1][0]
+                        self._written.notify_all()
+
+    def _write_batch(self, chats):
+        """
+        Write queued conversations together with the ones earlier batches failed to write. If the
+        transaction fails, every conversation is retried in a transaction of its own, so one bad
+        conversation does not discard the others.
+        """
+        # Snapshots hold whole conversations, so the latest one of each conversation is enough
+        pending = {key: chat for key, (chat, _) in self._retries.items()}
+        for chat in chats:
+            key = str(chat.get("conversation_id"))
+            pending[key] = chat
+            self._retries.pop(key, None)
+        if not pending:
+            return
+        try:
+            with telemetry.span("chat_history_flush", conversations=len(pending)):
+                self._save_chats(pending.values())
+                self.conn.commit()
+            self._retries.clear()
+            return
+        except Exception:
+            self.conn.rollback()
+        for key, chat in pending.items():
+            try:
+                self._save_chats([chat])
+                self.conn.commit()
+                self._retries.pop(key, None)
+            except Exception as e:
+                self.conn.rollback()
+                attempts = self._retries.get(key, (chat, 0))[1] + 1
+                if attempts < self.max_write_attempts:
+                    self._retries[key] = (chat, attempts)
+                    WRITE_ERRORS.inc(outcome="retried")
+                else:
+                    self._retries.pop(key, None)
+                    WRITE_ERRORS.inc(outcome="dropped")
+                self._report_write_error(e)
+
+    def _report_write_error(self, error):
+        self.last_write_error = error
+        with self._written:
+            self._unreported_error = error
+
+    def _wait_for_writes(self):
+        """
+        Block until the saves queued before this call are written. Does nothing without write_behind.
+        """
+        if self._queue is None:
+            return
+        with self._written:
+            target = self._queued_seq
+            while self._written_seq < target and self._writer is not None and self._writer.is_alive():
+                self._written.wait(timeout=self.flush_interval)
+
+    def flush(self):
+        """
+        Block until the saves queued before this call are written.
+
+        Raises:
+            RuntimeError: If a queued save failed since the previous flush. Conversations that
+                failed are retried with the next batches, up to max_write_attempts times.
+        """
+        self._wait_for_writes()
+        with self._written:
+            error, self._unreported_error = self._unreported_error, None
+        if error is not None:
+            raise RuntimeError(f"Saving chat history failed: {error!r}") from error
+
+    def _save_chats(self, chat_history):
+        """
+        Write conversations without committing.
         """
-        
         for chat in chat_history:
-            # Check if the chat already exists based on the UUID
-            self.cursor.execute(f"""
-            SELECT id FROM {self.table_name} WHERE uuid = ?
-            """, (str(chat["conversation_id"]),))
-            result = self.cursor.fetchone()
-
-            if result:
-                # Update the existing chat
-                self.cursor.execute(f"""
-                    UPDATE {self.table_name}
-                    SET create_date = ?, full_body = ?
-                    WHERE uuid = ?
-                    """, (chat["create_date"], json.dumps(chat, default=str), str(chat["conversation_id"])))
-            else:
-                # Insert a new chat
-                self.cursor.execute(f"""
-                    INSERT INTO {self.table_name} (uuid, create_date, full_body)
-                    VALUES (?, ?, ?)
-                    """, (str(chat["conversation_id"]), chat["create_date"], json.dumps(chat, default=str)))
-        self.conn.commit()
+            summary = json.dumps(chat["summary"]) if chat.get("summary") else None
+            self.cursor.execute("""
+                INSERT INTO conversations (uuid, header, create_date, summary)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (uuid) DO UPDATE SET header = excluded.header, summary = excluded.summary
+                RETURNING id, message_count
+                """, (str(chat["conversation_id"]), chat.get("header", ""), chat["create_date"], summary))
+            conversation_id, stored_count = self.cursor.fetchone()
+
+            new_messages = chat.get("history", [])[stored_count:]
+            if not new_messages:
+                continue
+            self.cursor.executemany("""
+                INSERT INTO messages (conversation_id, seq, role, content, create_date, extra)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """, [
+                    (conversation_id, stored_count + i, message["role"], message["content"], message["create_date"],
+                     self._message_extra(message))
+                    for i, message in enumerate(new_messages)
+                ])
+            self.cursor.execute("UPDATE conversations SET message_count = ? WHERE id = ?",
+                                (stored_count + len(new_messages), conversation_id))
+
+    @staticmethod
+    def _message_extra(message):
+        """
+        Serialise message fields other than role, content and create_date (e.g. turn metrics).
+        """
+        extra = {key: value for key, value in message.items() if key not in MESSAGE_FIELDS}
+        return json.dumps(extra, default=str) if extra else None
+
+    def read_chat_headers(self, limit=20, before=None):
+        """
+        Read one page of conversation headers, newest first, without loading any messages.
+
+        Args:
+            limit (int, optional): Maximum number of headers returned. Defaults to 20.
+            before (dict, optional): Last header of the previous page. The page starts right after it.
+
+        Returns:
+            list of dict: List of headers as dictionaries with keys 'conversation_id', 'header' and 'create_date'.
+        """
+        self._wait_for_writes()
+        if before is None:
+            self.cursor.execute("""
+                SELECT uuid, header, create_date FROM conversations
+                ORDER BY create_date DESC, uuid DESC LIMIT ?
+                """, (limit,))
+        else:
+            # Keyset pagination: seek past the last seen (create_date, uuid) using the index
+            self.cursor.execute("""
+                SELECT uuid, header, create_date FROM conversations
+                WHERE (create_date, uuid) < (?, ?)
+                ORDER BY create_date DESC, uuid DESC LIMIT ?
+                """, (before["create_date"], str(before["conversation_id"]), limit))
+        return [
+            {"conversation_id": row[0], "header": row[1], "create_date": row[2]}
+            for row in self.cursor.fetchall()
+        ]
+
+    def read_chat(self, conversation_id):
+        """
+        Read a single conversation with all its messages.
+
+        Args:
+            conversation_id (str): UUID of the conversation.
+
+        Returns:
+            dict or None: Conversation with keys 'conversation_id', 'header', 'create_date', 'summary'
+                and 'history', or None if it is not stored.
+        """
+        self._wait_for_writes()
+        self.cursor.execute(
+            "SELECT id, uuid, header, create_date, summary FROM conversations WHERE uuid = ?", (str(conversation_id),))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        self.cursor.execute(
+            "SELECT role, content, create_date, extra FROM messages WHERE conversation_id = ? ORDER BY seq", (row[0],))
+        return {
+            "conversation_id": row[1],
+            "header": row[2],
+            "create_date": row[3],
+            "summary": json.loads(row[4]) if row[4] else {},
+            "history": [self._message_from_row(*message) for message in self.cursor.fetchall()],
+        }
+
+    @staticmethod
+    def _message_from_row(role, content, create_date, extra):
+        message = {"role": role, "content": content, "create_date": create_date}
+        if extra:
+            message.update(json.loads(extra))
+        return message
 
     def read_all_chats(self):
         """
         Read all chat history from the database.
 
         Returns:
-            list of dict: List of chat messages as dictionaries with keys 'uuid', 'create_date', and 'full_body'.
-        """
-        self.cursor.execute(f"SELECT uuid, create_date, full_body FROM {self.table_name}")
-        rows = self.cursor.fetchall()
-        chat_history = []
-        for row in rows:
-            chat_history.append(
-                json.loads(row[2])
-            )
-        return chat_history
-        
+            list of dict: List of conversations as dictionaries with keys 'conversation_id', 'header',
+                'create_date', 'summary' and 'history'.
+        """
+        self._wait_for_writes()
+        self.cursor.execute("SELECT id, uuid, header, create_date, summary FROM conversations")
+        chats = {}
+        for row in self.cursor.fetchall():
+            chats[row[0]] = {
+                "conversation_id": row[1],
+                "header": row[2],
+                "create_date": row[3],
+                "summary": json.loads(row[4]) if row[4] else {},
+                "history": [],
+            }
+        self.cursor.execute(
+            "SELECT conversation_id, role, content, create_date, extra FROM messages ORDER BY conversation_id, seq")
+        for conversation_id, role, content, create_date, extra in self.cursor.fetchall():
+            chats[conversation_id]["history"].append(self._message_from_row(role, content, create_date, extra))
+        return list(chats.values())
+
     def close_connection(self):
         """
-        Close the database connection.
-        """
-        self.conn.close()
-
-        def read_all_chats(self):
-            """
-            Read all chat history from the database.
-
-            Returns:
-                list of dict: List of chat messages as dictionaries with keys 'uuid', 'create_date', and 'full_body'.
-            """
-            self.cursor.execute(f"SELECT uuid, create_date, full_body FROM {self.table_name}")
-            rows = self.cursor.fetchall()
-            chat_history = []
-            for row in rows:
-                chat_history.append(
-                    json.loads(row[2])
-                )
-            return chat_history
+        Write any queued saves, stop the background writer and close all connections.
+        """
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._connections_lock:
+            for state in list(self._connections):
+                state.finalizer()
+            self._connections.clear()
+        self._local = threading.local()
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+
+from inference import (INFERENCE_BACKEND, BATCH_WAIT_MS, BatchedCrossEncoder, BatchedTextClassifier,
+                       OnnxCrossEncoder, OnnxTextClassifier, load_onnx_classifier)
+
+RERANKER_MODEL = "mixedbread-ai/mxbai-rerank-xsmall-v1"
+TOXICITY_MODEL = "textdetox/xlmr-large-toxicity-classifier"
+LOCAL_EMBEDDING_MODEL = os.getenv("NOMAD_LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+def _estimate_model_bytes(model):
+    """
+    Estimate memory held by a loaded model by summing the sizes of its torch
+    parameters and buffers, or from the size of its ONNX file. Wrappers are unwrapped
+    through their 'model' attribute. Returns 0 if neither is available.
+    """
+    module = model
+    while not hasattr(module, "parameters"):
+        if hasattr(module, "memory_bytes"):
+            return module.memory_bytes
+        if not hasattr(module, "model"):
+            return 0
+        module = module.model
+    total = 0
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    """
+    A process-wide registry of lazily loaded models shared by the bot engine
+    and the toxicity analyzer.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty ModelRegistry instance.
+        """
+        self._factories = {}
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        """
+        Register a factory used to load a model on first use.
+
+        Args:
+            name (str): Name under which the model is stored.
+            factory (callable): Zero-argument callable returning the loaded model.
+        """
+        with self._lock:
+            self._factories.setdefault(name, factory)
+
+    def get(self, name):
+        """
+        Return the model registered under the given name, loading it if needed.
+
+        Args:
+            name (str): Name of the registered model.
+
+        Returns:
+            object: The loaded model.
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                if name not in self._factories:
+                    raise KeyError(f"No model registered under '{name}'")
+                start = time.perf_counter()
+                model = self._factories[name]()
+                self._models[name] = model
+                self._stats[name] = {
+                    "load_seconds": time.perf_counter() - start,
+                    "memory_bytes": _estimate_model_bytes(model),
+                }
+            return self._models[name]
+
+    def is_loaded(self, name):
+        """
+        Check whether the model is currently held in memory.
+        """
+        return name in self._models
+
+    def warm_up(self, names=None):
+        """
+        Load models ahead of the first request.
+
+        Args:
+            names (list of str, optional): Models to load. Defaults to all registered models.
+        """
+        for name in names or list(self._factories):
+            self.get(name)
+
+    def unload(self, name):
+        """
+        Drop the model from memory. It will be loaded again on next use.
+
+        Args:
+            name (str): Name of the registered model.
+        """
+        with self._lock:
+            self._models.pop(name, None)
+            self._stats.pop(name, None)
+
+    def reload(self, name):
+        """
+        Unload the model and load it again from its factory.
+
+        Args:
+            name (str): Name of the registered model.
+
+        Returns:
+            object: The freshly loaded model.
+        """
+        with self._lock:
+            self.unload(name)
+            return self.get(name)
+
+    def memory_usage(self):
+        """
+        Report load time and estimated memory of every loaded model.
+
+        Returns:
+            dict: Mapping of model name to a dict with 'load_seconds' and 'memory_bytes'.
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+def load_reranker(backend=None, batch_wait_ms=None):
+    """
+    Load the reranker with the given backend ('torch', 'onnx' or 'onnx-int8'), wrapped in a
+    micro-batching queue when batch_wait_ms is positive. Both default to the environment settings.
+    """
+    backend = backend or INFERENCE_BACKEND
+    if backend == "torch":
+        from sentence_transformers import CrossEncoder
+        model = CrossEncoder(RERANKER_MODEL)
+    else:
+        model = OnnxCrossEncoder(load_onnx_classifier(RERANKER_MODEL, quantized=backend == "onnx-int8"))
+    batch_wait_ms = BATCH_WAIT_MS if batch_wait_ms is None else batch_wait_ms
+    return BatchedCrossEncoder(model, max_wait=batch_wait_ms / 1000) if batch_wait_ms > 0 else model
+
+
+def load_toxicity_pipeline(model_name=TOXICITY_MODEL, backend=None, batch_wait_ms=None):
+    """
+    Load the toxicity classifier with the given backend ('torch', 'onnx' or 'onnx-int8'), wrapped in a
+    micro-batching queue when batch_wait_ms is positive. Both default to the environment settings.
+    """
+    backend = backend or INFERENCE_BACKEND
+    if backend == "torch":
+        from transformers import pipeline
+        model = pipeline("text-classification", model=model_name)
+    else:
+        model = OnnxTextClassifier(load_onnx_classifier(model_name, quantized=backend == "onnx-int8"))
+    batch_wait_ms = BATCH_WAIT_MS if batch_wait_ms is None else batch_wait_ms
+    return BatchedTextClassifier(model, max_wait=batch_wait_ms / 1000) if batch_wait_ms > 0 else model
+
+
+def load_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(LOCAL_EMBEDDING_MODEL, device="cpu")
+
+
+registry = ModelRegistry()
+registry.register("reranker", load_reranker)
+registry.register("toxicity", load_toxicity_pipeline)
+registry.register("embedder", load_embedder)
@@ -0,0 +1,130 @@
+def approximate_token_count(text):
+    """
+    Estimate the number of tokens in a text (about four characters per token for English).
+    """
+    return len(text) // 4 + 1
+
+
+class PromptBuilder:
+    """
+    A class to assemble the retrieved context and conversation history into a prompt
+    that stays within a token budget.
+    """
+
+    def __init__(self, token_budget=3000, recent_messages=6, summarize_every=4, count_tokens=approximate_token_count):
+        """
+        Initialize the PromptBuilder instance.
+
+        Args:
+            token_budget (int, optional): Maximum number of tokens for the variable parts of the
+                prompt (context, knowledge base and history). Defaults to 3000.
+            recent_messages (int, optional): Number of most recent messages kept verbatim. Defaults to 6.
+            summarize_every (int, optional): Number of messages that must fall out of the window
+                before the summary is updated. Defaults to 4.
+            count_tokens (callable, optional): Function returning the token count of a text.
+        """
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.summarize_every = summarize_every
+        self.count_tokens = count_tokens
+
+    @staticmethod
+    def previous_messages(history, query):
+        """
+        Return the history without the current question, which is sent separately as the user message.
+        """
+        if history and history[-1].get("role") == "human" and history[-1].get("content") == query:
+            return history[:-1]
+        return history
+
+    def split_history(self, history, query):
+        """
+        Split the history into messages that should be summarised and the recent window.
+
+        Returns:
+            tuple: (older messages, recent messages)
+        """
+        messages = self.previous_messages(history, query)
+        cut = max(len(messages) - self.recent_messages, 0)
+        return messages[:cut], messages[cut:]
+
+    def build_sections(self, query, documents, faq_documents, history, summary_state=None):
+        """
+        Fill prompt sections in priority order until the token budget is spent.
+        Priority: reranked documents, history not yet summarised (newest first), conversation
+        summary, remaining FAQ entries. FAQ entries already present in the reranked documents
+        are skipped.
+
+        Args:
+            query (str): The user question.
+            documents (list of str): Reranked documents.
+            faq_documents (list of str): FAQ documents returned by the vector search.
+            history (list of dict): Conversation history.
+            summary_state (dict, optional): Summary of older turns with keys 'text' and 'covered'.
+
+        Returns:
+            dict: Formatted 'context', 'faq', 'summary' and 'history' sections.
+        """
+        remaining = self.token_budget
+
+        def take(items):
+            nonlocal remaining
+            taken = []
+            for item in items:
+                cost = self.count_tokens(item)
+                if cost > remaining:
+                    break
+                taken.append(item)
+                remaining -= cost
+            return taken
+
+        context_items = [
+            f"<Relevant Document #{i+1}>\n{document}\n</Relevant Document #{i+1}>\n"
+            for i, document in enumerate(documents)
+        ]
+        context = "".join(take(context_items)) or "No relevant documents found for context"
+
+        # Everything not folded into the summary yet is a candidate, so no message falls in between
+        covered = (summary_state or {}).get("covered", 0)
+        recent = self.previous_messages(history, query)[covered:]
+        recent_items = [f"{message['role']}: {message['content']}" for message in recent]
+        # Newest messages are the most important, so they are taken first
+        recent_items = list(reversed(take(reversed(recent_items))))
+
+        summary_text = (summary_state or {}).get("text", "")
+        summary = "".join(take([summary_text])) if summary_text else ""
+
+        seen = set(documents)
+        faq_items = take([document for document in faq_documents if document not in seen])
+
+        return {
+            "context": context,
+            "faq": "\n".join(faq_items) or "None",
+            "summary": summary or "None",
+            "history": "\n".join(recent_items) or "None",
+        }
+
+    def update_summary(self, summary_state, history, query, summarize):
+        """
+        Fold messages that left the recent window into the running summary.
+        The summary is only updated once enough new messages have accumulated.
+
+        Args:
+            summary_state (dict): Summary with keys 'text' and 'covered' (number of messages
+                already folded in). Updated in place.
+            history (list of dict): Conversation history.
+            query (str): The current user question.
+            summarize (callable): Function taking the previous summary and a list of messages
+                and returning the new summary text.
+
+        Returns:
+            bool: True if the summary was updated.
+        """
+        older, _ = self.split_history(history, query)
+        covered = summary_state.get("covered", 0)
+        if len(older) - covered < self.summarize_every:
+            return False
+        text = summarize(summary_state.get("text", ""), older[covered:])
+        # Both keys change at once, as the summary may be read by the next turn while it is updated
+        summary_state.update(text=text, covered=len(older))
+        return True
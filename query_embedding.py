@@ -0,0 +1,56 @@
+import re
+
+from caching import LRUTTLCache
+from instrumentation import telemetry
+
+EMBEDDED_TEXTS = telemetry.counter("nomad_embedded_texts_total", "Texts sent to the embedding function.")
+QUERY_CACHE_LOOKUPS = telemetry.counter("nomad_query_embedding_cache_total", "Query embedding cache lookups by result.")
+
+
+def normalize_query(text):
+    """
+    Normalise query text so trivially different spellings share a cache entry.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryEmbedder:
+    """
+    A class that embeds user queries once per turn and caches the vectors
+    so repeated questions skip the embedding call.
+    """
+
+    def __init__(self, embedding_function, maxsize=1024, ttl=3600):
+        """
+        Initialize the QueryEmbedder instance.
+
+        Args:
+            embedding_function (callable): Chroma embedding function used for the collections.
+            maxsize (int, optional): Maximum number of cached query vectors. Defaults to 1024.
+            ttl (float, optional): Seconds a cached vector stays valid. Defaults to 3600.
+        """
+        self.embedding_function = embedding_function
+        self.cache = LRUTTLCache(maxsize=maxsize, ttl=ttl)
+        self.embedding_calls = 0
+
+    def embed(self, text):
+        """
+        Return the embedding of the query, computing it only on a cache miss.
+
+        Args:
+            text (str): The user query.
+
+        Returns:
+            list of float: The query embedding.
+        """
+        key = normalize_query(text)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            QUERY_CACHE_LOOKUPS.inc(result="miss")
+            EMBEDDED_TEXTS.inc(kind="query")
+            self.embedding_calls += 1
+            embedding = list(self.embedding_function([text])[0])
+            self.cache.set(key, embedding)
+        else:
+            QUERY_CACHE_LOOKUPS.inc(result="hit")
+        return embedding
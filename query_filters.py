@@ -0,0 +1,284 @@
+import re
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "april": 4, "apr": 4, "may": 5,
+    "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8, "september": 9, "sept": 9, "sep": 9,
+    "october": 10, "oct": 10, "november": 11, "nov": 11, "december": 12, "dec": 12,
+}
+SEASONS = {"spring": [3, 4, 5], "summer": [6, 7, 8], "autumn": [9, 10, 11], "winter": [12, 1, 2]}
+NUMBER_WORDS = {"one": 1, "a": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+# Place names that are also ordinary English words only count when capitalised
+AMBIGUOUS_PLACES = {"nice", "split"}
+# Generic words left after dropping the activity type ("City tour" -> "city") never match on their own
+GENERIC_ACTIVITY_WORDS = {"city", "local", "cultural", "historic", "historical", "old", "art", "day", "the"}
+ACTIVITY_TYPES = ("day", "visit", "tour", "walk", "show", "class", "trip", "excursion")
+
+MONTH_PATTERN = re.compile(
+    r"\b(?:(in|during|for|of|early|mid|late|until|from)\s+)?(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\b(\s+20\d\d)?")
+MAX_PRICE_PATTERN = re.compile(
+    r"\b(?:under|below|less than|at most|max(?:imum)?|up to|cheaper than|no more than|within|budget(?: of| is)?)\s*(?:€|eur\s*)?(\d[\d,. ]*k?)")
+MIN_PRICE_PATTERN = re.compile(r"\b(?:over|above|more than|at least|min(?:imum)?)\s*(?:€|eur\s*)?(\d[\d,. ]*k?)\s*(?:€|eur|euros?)")
+DAY_RANGE_PATTERN = re.compile(r"\b(\d+)\s*(?:-|to|–)\s*(\d+)\s*days?\b")
+DAYS_PATTERN = re.compile(r"\b(\d+|" + "|".join(word for word in NUMBER_WORDS if word != "a") + r")[\s-]*days?\b")
+WEEKS_PATTERN = re.compile(r"\b(\d+|" + "|".join(NUMBER_WORDS) + r")[\s-]*weeks?\b")
+# "up to 5 days" is a duration, not a price
+DURATION_UNIT_PATTERN = re.compile(r"\s*(?:days?|weeks?|nights?|people|persons?)\b")
+# Comparator right before a duration: "up to 2 weeks" caps it, "at least 10 days" sets a minimum,
+# strict ones ("shorter than 5 days") exclude the number itself
+DURATION_COMPARATORS = {
+    "under": ("max", 1), "below": ("max", 1), "less than": ("max", 1), "shorter than": ("max", 1), "fewer than": ("max", 1),
+    "up to": ("max", 0), "at most": ("max", 0), "within": ("max", 0), "no more than": ("max", 0), "no longer than": ("max", 0),
+    "max": ("max", 0), "maximum": ("max", 0), "maximum of": ("max", 0),
+    "over": ("min", 1), "above": ("min", 1), "more than": ("min", 1), "longer than": ("min", 1),
+    "at least": ("min", 0), "min": ("min", 0), "minimum": ("min", 0), "minimum of": ("min", 0), "no less than": ("min", 0),
+}
+DURATION_COMPARATOR_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(DURATION_COMPARATORS, key=len, reverse=True)) + r")\s+$")
+YEAR_PATTERN = re.compile(r"\b(?:in|during|for|of)\s+(20\d\d)\b")
+NOTICE_PATTERN = re.compile(r"'?\s*(?:before|prior|in advance|ahead|after|(?:of\s+)?notice)\b")
+# A date in a question about an existing booking or a policy ("booked in may") is not a trip date
+BOOKING_TERMS_PATTERN = re.compile(
+    r"\b(?:book(?:ed|ing|ings)?|reserv\w*|cancel\w*|refund\w*|pa(?:y|id|yment)|deposit|insurance|polic(?:y|ies)|visa|passport)\b")
+TRIP_TERMS_PATTERN = re.compile(r"\b(?:trips?|travel\w*|tours?|holidays?|vacations?|getaways?|journeys?|visit\w*|depart\w*)\b")
+
+
+def activity_field(activity):
+    """
+    Name of the boolean metadata field flagging a trip with the given activity, e.g. 'activity_wine_tasting'.
+    """
+    return "activity_" + re.sub(r"[^a-z0-9]+", "_", activity.lower()).strip("_")
+
+
+def _number(text):
+    text = text.strip().rstrip(".,").replace(" ", "")
+    if text in NUMBER_WORDS:
+        return NUMBER_WORDS[text]
+    multiplier = 1000 if text.endswith("k") else 1
+    digits = text.rstrip("k")
+    # "1.000" and "1,000" group thousands, "1.5" and "1,5" have decimals
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", digits):
+        digits = re.sub(r"[.,]", "", digits)
+    else:
+        digits = digits.replace(",", ".")
+    try:
+        return int(float(digits) * multiplier)
+    except ValueError:
+        return None
+
+
+def metadata_matches(metadata, where):
+    """
+    Evaluate a Chroma where filter against one metadata dict. Supports $and, $or, $eq, $ne,
+    $gt, $gte, $lt, $lte, $in and $nin, and the {field: value} shorthand for $eq.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(metadata_matches(metadata, part) for part in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            operators = condition if isinstance(condition, dict) else {"$eq": condition}
+            for operator, operand in operators.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+                if operator in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if operator == "$gt" and not value > operand:
+                        return False
+                    if operator == "$gte" and not value >= operand:
+                        return False
+                    if operator == "$lt" and not value < operand:
+                        return False
+                    if operator == "$lte" and not value <= operand:
+                        return False
+    return True
+
+
+class TripQueryFilter:
+    """
+    A rule-based extractor turning constraints mentioned in a question (countries, cities, price caps,
+    months, durations and activities) into a Chroma where filter over the trip metadata.
+    """
+
+    def __init__(self, trips):
+        """
+        Initialize the TripQueryFilter instance with the vocabulary of the trip catalogue.
+
+        Args:
+            trips (iterable of dict): Trips in the format of data/trips_data.json.
+        """
+        self.countries = {}
+        self.cities = {}
+        self.city_countries = {}
+        self.activities = {}
+        for trip in trips:
+            self.countries[trip["Country"].lower()] = trip["Country"]
+            self.cities[trip["City"].lower()] = trip["City"]
+            self.city_countries[trip["City"]] = trip["Country"]
+            for activity in trip["Extra activities"]:
+                self.activities.setdefault(activity.lower(), set()).add(activity_field(activity))
+                # "Museum visit" is also found by "museum", "Beach day" by "beach"
+                words = activity.lower().split()
+                if len(words) > 1 and words[-1] in ACTIVITY_TYPES:
+                    stem = " ".join(words[:-1])
+                    if stem not in GENERIC_ACTIVITY_WORDS:
+                        self.activities.setdefault(stem, set()).add(activity_field(activity))
+        self.country_pattern = self._names_pattern(self.countries)
+        self.city_pattern = self._names_pattern(self.cities)
+        self.activity_pattern = self._names_pattern(self.activities, plural=True)
+
+    @staticmethod
+    def _names_pattern(names, plural=False):
+        alternatives = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+        return re.compile(r"\b(" + alternatives + r")" + (r"(?:e?s)?" if plural else "") + r"\b")
+
+    def _places(self, pattern, names, question):
+        found = []
+        lowered = question.lower()
+        for match in pattern.finditer(lowered):
+            name = match.group(1)
+            if name in AMBIGUOUS_PLACES and not question[match.start(1)].isupper():
+                continue
+            if names[name] not in found:
+                found.append(names[name])
+        return found
+
+    def extract(self, question):
+        """
+        Extract the constraints mentioned in the question.
+
+        Returns:
+            dict: Any of 'countries', 'cities', 'min_price', 'max_price', 'months', 'years', 'min_days',
+                'max_days' and 'activities' (metadata field names).
+        """
+        lowered = question.lower()
+        constraints = {}
+
+        cities = self._places(self.city_pattern, self.cities, question)
+        # A country is redundant when one of its cities is named
+        countries = [country for country in self._places(self.country_pattern, self.countries, question)
+                     if country not in {self.city_countries[city] for city in cities}]
+        if cities:
+            constraints["cities"] = cities
+        if countries:
+            constraints["countries"] = countries
+
+        # Prices, dates and durations in questions about bookings or policies ("a refund if I cancel
+        # 14 days before") are not trip constraints, unless the question also talks about a trip
+        if cities or countries or TRIP_TERMS_PATTERN.search(lowered) or not BOOKING_TERMS_PATTERN.search(lowered):
+            self._extract_prices(lowered, constraints)
+            self._extract_dates(lowered, constraints)
+            self._extract_duration(lowered, constraints)
+
+        activities = []
+        for match in self.activity_pattern.finditer(lowered):
+            activities.extend(field for field in sorted(self.activities[match.group(1)]) if field not in activities)
+        if activities:
+            constraints["activities"] = activities
+        return constraints
+
+    @staticmethod
+    def _extract_prices(lowered, constraints):
+        match = MAX_PRICE_PATTERN.search(lowered)
+        if match and _number(match.group(1)) and not DURATION_UNIT_PATTERN.match(lowered, match.end()):
+            constraints["max_price"] = _number(match.group(1))
+        match = MIN_PRICE_PATTERN.search(lowered)
+        if match and _number(match.group(1)):
+            constraints["min_price"] = _number(match.group(1))
+
+    @staticmethod
+    def _extract_dates(lowered, constraints):
+        months = []
+        years = []
+        for match in MONTH_PATTERN.finditer(lowered):
+            preposition, name, year = match.groups()
+            # "may" and "march" are common words, so they need a preposition or a year next to them
+            if name in ("may", "march") and not (preposition or year):
+                continue
+            if MONTHS[name] not in months:
+                months.append(MONTHS[name])
+            if year and int(year) not in years:
+                years.append(int(year))
+        for season, season_months in SEASONS.items():
+            if re.search(r"\b" + season + r"\b", lowered):
+                months.extend(month for month in season_months if month not in months)
+        years.extend(int(year) for year in YEAR_PATTERN.findall(lowered) if int(year) not in years)
+        if months:
+            constraints["months"] = months
+        if years:
+            constraints["years"] = years
+
+    @staticmethod
+    def _extract_duration(lowered, constraints):
+        match = DAY_RANGE_PATTERN.search(lowered)
+        # "cancel 14 days before" is a notice period, not a trip length
+        duration = next((match for pattern in (DAYS_PATTERN, WEEKS_PATTERN) for match in pattern.finditer(lowered)
+                         if not NOTICE_PATTERN.match(lowered, match.end())), None)
+        if match:
+            constraints["min_days"], constraints["max_days"] = sorted(int(group) for group in match.groups())
+        elif duration:
+            days = _number(duration.group(1)) * (1 if duration.re is DAYS_PATTERN else 7)
+            comparator = DURATION_COMPARATOR_PATTERN.search(lowered, 0, duration.start())
+            bound, strict = DURATION_COMPARATORS[comparator.group(1)] if comparator else (None, 0)
+            # Only a bare "5 days" asks for that exact duration
+            if bound != "min":
+                constraints["max_days"] = days - strict
+            if bound != "max":
+                constraints["min_days"] = days + strict
+        elif "long weekend" in lowered:
+            constraints["max_days"] = 4
+        elif "weekend" in lowered:
+            constraints["max_days"] = 3
+
+    @staticmethod
+    def to_where(constraints):
+        """
+        Build a Chroma where filter from extracted constraints.
+
+        Returns:
+            dict or None: The filter, or None if there are no constraints.
+        """
+        conditions = []
+        places = []
+        if "cities" in constraints:
+            places.append({"city": {"$in": constraints["cities"]}})
+        if "countries" in constraints:
+            places.append({"country": {"$in": constraints["countries"]}})
+        if places:
+            conditions.append(places[0] if len(places) == 1 else {"$or": places})
+        if "max_price" in constraints:
+            conditions.append({"price": {"$lte": constraints["max_price"]}})
+        if "min_price" in constraints:
+            conditions.append({"price": {"$gte": constraints["min_price"]}})
+        if "months" in constraints:
+            conditions.append({"start_month": {"$in": constraints["months"]}})
+        if "years" in constraints:
+            conditions.append({"start_year": {"$in": constraints["years"]}})
+        if "min_days" in constraints:
+            conditions.append({"duration": {"$gte": constraints["min_days"]}})
+        if "max_days" in constraints:
+            conditions.append({"duration": {"$lte": constraints["max_days"]}})
+        if "activities" in constraints:
+            flags = [{field: {"$eq": True}} for field in constraints["activities"]]
+            conditions.append(flags[0] if len(flags) == 1 else {"$or": flags})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def where(self, question):
+        """
+        Return the Chroma where filter for the question, or None if it mentions no constraints.
+        """
+        return self.to_where(self.extract(question))
@@ -0,0 +1,224 @@
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+from caching import LRUTTLCache
+from inference import encode_pairs, encoded_pair_scorer
+from instrumentation import telemetry
+from model_registry import registry
+
+ADAPTIVE_RERANK = os.getenv("NOMAD_ADAPTIVE_RERANK", "1") != "0"
+# Cosine distance behind the best candidate beyond which a candidate is not worth scoring
+RERANK_MARGIN = float(os.getenv("NOMAD_RERANK_MARGIN", "0.1"))
+
+RERANK_DECISIONS = telemetry.counter("nomad_rerank_decisions_total", "Rerank calls by decision: full, shrunk or single.")
+RERANK_PAIRS = telemetry.counter("nomad_rerank_pairs_total", "(query, document) pairs scored by the reranker.")
+
+
+class AdaptiveReranker:
+    """
+    Reranks retrieval candidates with the cross-encoder and does less work where it can:
+
+    - candidates whose vector distance is more than margin behind the best one of their collection
+      are dropped; when this leaves a single candidate, only that one is scored, to check it
+      against the score threshold;
+    - only the first candidate_count results of each collection are scored, a count tuned from
+      the retrieval ranks the reranker actually keeps;
+    - document token ids are cached by document id, so a call only tokenizes the query.
+
+    Every explore_every-th call scores all candidates. These calls feed the rank statistics and
+    measure how often the adaptive selection agrees with the full rerank.
+    """
+
+    def __init__(self, model=None, adaptive=ADAPTIVE_RERANK, margin=RERANK_MARGIN, max_candidates=5, min_candidates=2,
+                 keep_rate=0.02, explore_every=10, window=500, min_observations=30, token_cache_size=4096):
+        """
+        Initialize the AdaptiveReranker instance.
+
+        Args:
+            model (callable, optional): Returns the cross-encoder. Defaults to the registry's reranker.
+            adaptive (bool, optional): Apply the margin and the candidate count; when False every call
+                scores all candidates. Defaults to NOMAD_ADAPTIVE_RERANK.
+            margin (float, optional): Cosine distance margin, see above; 0 disables it. Defaults to NOMAD_RERANK_MARGIN.
+            max_candidates (int, optional): Results per collection scored by a full rerank. Defaults to 5.
+            min_candidates (int, optional): Lower bound of the tuned candidate count. Defaults to 2.
+            keep_rate (float, optional): A retrieval rank is scored while at least this share of its
+                candidates end up in the context. Defaults to 0.02.
+            explore_every (int, optional): Every this many calls run a full rerank. Defaults to 10.
+            window (int, optional): Number of recent full reranks the statistics are computed from. Defaults to 500.
+            min_observations (int, optional): Full reranks needed before the candidate count is tuned. Defaults to 30.
+            token_cache_size (int, optional): Maximum number of tokenized documents kept. Defaults to 4096.
+        """
+        self.model = model or (lambda: registry.get("reranker"))
+        self.adaptive = adaptive
+        self.margin = margin
+        self.max_candidates = max_candidates
+        self.min_candidates = min_candidates
+        self.keep_rate = keep_rate
+        self.explore_every = explore_every
+        self.min_observations = min_observations
+        self.candidate_count = max_candidates
+        self.token_cache = LRUTTLCache(maxsize=token_cache_size)
+        # Per full rerank: (retrieval rank, kept in the context) of every candidate
+        self.observations = deque(maxlen=window)
+        self.decisions = {"full": 0, "shrunk": 0, "single": 0}
+        self.pairs_scored = 0
+        self.pairs_total = 0
+        self.agreement = {"compared": 0, "top1": 0, "recall": 0.0}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def rerank(self, query, candidates, n_items=3, min_score_threshold=0.5, info=None):
+        """
+        Return the texts of the best candidates, best first.
+
+        Args:
+            query (str): The user question.
+            candidates (list of dict): Candidates with 'id', 'text', 'collection', 'rank' (position in the
+                results of their collection) and 'distance' (cosine distance to the query, or None if unknown).
+            n_items (int, optional): Maximum number of texts returned. Defaults to 3.
+            min_score_threshold (float, optional): Minimum reranker score of a returned text. Defaults to 0.5.
+            info (dict, optional): Filled with the 'decision' and the number of 'scored' candidates.
+
+        Returns:
+            list of str: Texts of the selected candidates.
+        """
+        info = {} if info is None else info
+        with self._lock:
+            self.calls += 1
+            explore = not self.adaptive or self.calls % self.explore_every == 0
+        selected, single = self.select(candidates)
+
+        if explore:
+            scores = self.score(query, candidates)
+            kept = self._keep(scores, n_items, min_score_threshold)
+            if self.adaptive:
+                # Cross-encoder scores are per pair, so the adaptive choice can be read off the same scores
+                chosen = {id(candidate) for candidate in selected}
+                positions = [i for i, candidate in enumerate(candidates) if id(candidate) in chosen]
+                adaptive_kept = [positions[i] for i in self._keep(scores[positions], n_items, min_score_threshold)]
+                self._compare(candidates, kept, adaptive_kept)
+            self._observe(candidates, kept)
+            decision, scored, result = "full", len(candidates), [candidates[i]["text"] for i in kept]
+        else:
+            # A single clear winner is still scored, so it has to pass min_score_threshold like any other
+            scores = self.score(query, selected)
+            decision = "single" if single else "shrunk" if len(selected) < len(candidates) else "full"
+            scored, result = len(selected), [selected[i]["text"] for i in self._keep(scores, n_items, min_score_threshold)]
+
+        with self._lock:
+            self.decisions[decision] += 1
+            self.pairs_scored += scored
+            self.pairs_total += len(candidates)
+        RERANK_DECISIONS.inc(decision=decision)
+        info.update(decision=decision, scored=scored)
+        return result
+
+    def select(self, candidates):
+        """
+        Choose the candidates worth scoring.
+
+        The margin applies within each collection, as FAQ and trip distances are not comparable.
+
+        Returns:
+            tuple: (selected candidates, whether the margin left a single clear winner)
+        """
+        selected = [candidate for candidate in candidates if candidate["rank"] < self.candidate_count]
+        if self.margin <= 0:
+            return selected, False
+        best = {}
+        for candidate in selected:
+            if candidate.get("distance") is not None:
+                collection = candidate.get("collection")
+                best[collection] = min(best.get(collection, candidate["distance"]), candidate["distance"])
+        if not best:
+            return selected, False
+        # Candidates found only by the lexical search have no distance and are always kept
+        close = [candidate for candidate in selected if candidate.get("distance") is None
+                 or candidate["distance"] <= best[candidate.get("collection")] + self.margin]
+        return close, len(close) == 1 and len(selected) > 1
+
+    def score(self, query, candidates):
+        """
+        Score the candidates with the cross-encoder, reusing cached document token ids when the
+        model exposes its tokenizer.
+
+        Returns:
+            numpy.ndarray: One score per candidate.
+        """
+        if not candidates:
+            return np.zeros(0)
+        model = self.model()
+        scorer = encoded_pair_scorer(model)
+        if scorer is None:
+            scores = model.predict([(query, candidate["text"]) for candidate in candidates])
+        else:
+            tokenizer, max_length, predict = scorer
+            documents = [self.document_tokens(tokenizer, candidate["id"], candidate["text"]) for candidate in candidates]
+            scores = predict(encode_pairs(tokenizer, query, documents, max_length))
+        RERANK_PAIRS.inc(len(candidates))
+        return np.asarray(scores, dtype=np.float32)
+
+    def document_tokens(self, tokenizer, document_id, text):
+        """
+        Return the token ids of a document, tokenizing it only on first use or when its text changed.
+        """
+        cached = self.token_cache.get(document_id)
+        if cached is not None and cached[0] == text:
+            return cached[1]
+        token_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+        self.token_cache.set(document_id, (text, token_ids))
+        return token_ids
+
+    @staticmethod
+    def _keep(scores, n_items, min_score_threshold):
+        best = np.argsort(-scores, kind="stable")[:n_items]
+        return [int(i) for i in best if scores[i] >= min_score_threshold]
+
+    def _observe(self, candidates, kept):
+        kept = set(kept)
+        with self._lock:
+            self.observations.append([(candidate["rank"], i in kept) for i, candidate in enumerate(candidates)])
+            if len(self.observations) < self.min_observations:
+                return
+            seen = np.zeros(self.max_candidates)
+            used = np.zeros(self.max_candidates)
+            for observation in self.observations:
+                for rank, was_kept in observation:
+                    if rank < self.max_candidates:
+                        seen[rank] += 1
+                        used[rank] += was_kept
+            useful = np.flatnonzero((seen > 0) & (used >= self.keep_rate * seen))
+            self.candidate_count = max(self.min_candidates, int(useful.max()) + 1 if len(useful) else 0)
+
+    def _compare(self, candidates, kept, adaptive_kept):
+        full = [candidates[i]["id"] for i in kept]
+        adaptive = [candidates[i]["id"] for i in adaptive_kept]
+        with self._lock:
+            self.agreement["compared"] += 1
+            self.agreement["top1"] += full[:1] == adaptive[:1]
+            self.agreement["recall"] += len(set(full) & set(adaptive)) / len(full) if full else 1.0
+
+    def stats(self):
+        """
+        Return decision counts, the share of candidate pairs actually scored, the tuned candidate count
+        and the agreement with the full rerank measured on exploration calls.
+
+        Returns:
+            dict: Dictionary with 'decisions', 'scored_ratio', 'candidate_count', 'agreement' and 'token_cache'.
+        """
+        with self._lock:
+            compared = self.agreement["compared"]
+            return {
+                "decisions": dict(self.decisions),
+                "scored_ratio": self.pairs_scored / self.pairs_total if self.pairs_total else 0.0,
+                "candidate_count": self.candidate_count,
+                "agreement": {
+                    "compared": compared,
+                    "top1": self.agreement["top1"] / compared if compared else None,
+                    "recall": self.agreement["recall"] / compared if compared else None,
+                },
+                "token_cache": self.token_cache.stats(),
+            }
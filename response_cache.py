@@ -0,0 +1,239 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+def files_fingerprint(paths):
+    """
+    Compute a hash over the contents of the given files.
+
+    Args:
+        paths (list of str): Files whose content the cached answers depend on.
+
+    Returns:
+        str: Hex digest that changes whenever any of the files changes.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class SemanticResponseCache:
+    """
+    A class to cache final answers in SQLite and serve them for semantically similar questions.
+
+    Questions that only differ in a city, month or price embed almost identically, so every entry
+    also has a key (e.g. the constraints extracted from the question) that must match exactly.
+    """
+
+    def __init__(self, db_path, source_paths=(), threshold=0.96, ttl=24 * 3600, max_entries=5000):
+        """
+        Initialize the SemanticResponseCache instance.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+            source_paths (list of str, optional): Data files the answers are based on. The cache is
+                cleared whenever their content changes.
+            threshold (float, optional): Minimum cosine similarity for a hit. Defaults to 0.96.
+            ttl (float, optional): Seconds an entry stays valid. Defaults to one day.
+            max_entries (int, optional): Maximum number of entries before least recently used
+                ones are evicted. Defaults to 5000.
+        """
+        self.db_path = db_path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                context TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_hit_at REAL NOT NULL,
+                key TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        self.cursor.execute("PRAGMA table_info(response_cache)")
+        if "key" not in {row[1] for row in self.cursor.fetchall()}:
+            # Entries cached before keys existed may answer a question with other constraints
+            self.cursor.execute("DELETE FROM response_cache")
+            self.cursor.execute("ALTER TABLE response_cache ADD COLUMN key TEXT NOT NULL DEFAULT ''")
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        if source_paths:
+            self.invalidate_if_changed(files_fingerprint(source_paths))
+        self.cursor.execute("DELETE FROM response_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        self.conn.commit()
+        self._load_vectors()
+
+    def _load_vectors(self):
+        """
+        Load the stored embeddings into an in-memory matrix used for similarity search.
+        """
+        self.cursor.execute("SELECT id, embedding, key FROM response_cache")
+        rows = self.cursor.fetchall()
+        self._ids = [row[0] for row in rows]
+        self._keys = [row[2] for row in rows]
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = None
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def invalidate_if_changed(self, fingerprint):
+        """
+        Clear the cache if the data fingerprint differs from the one it was filled with.
+
+        Args:
+            fingerprint (str): Fingerprint of the current data files.
+        """
+        with self._lock:
+            self.cursor.execute("SELECT value FROM response_cache_meta WHERE key = 'fingerprint'")
+            row = self.cursor.fetchone()
+            if row is None or row[0] != fingerprint:
+                self.cursor.execute("""
+                    INSERT INTO response_cache_meta (key, value) VALUES ('fingerprint', ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """, (fingerprint,))
+                self._clear()
+
+    def _clear(self):
+        """
+        Delete all entries. Caller must hold the lock.
+        """
+        self.cursor.execute("DELETE FROM response_cache")
+        self.conn.commit()
+        self._ids, self._keys, self._matrix = [], [], None
+
+    def _check_dimensions(self, vector):
+        """
+        Clear the cache if it holds embeddings of another size, i.e. from another embedding model. Caller must hold the lock.
+        """
+        if self._matrix is not None and self._matrix.shape[1] != vector.shape[0]:
+            self._clear()
+
+    def lookup(self, embedding, key=""):
+        """
+        Find a cached answer for a question similar to the given embedding.
+
+        Args:
+            embedding (list of float): Embedding of the user question.
+            key (str, optional): Key the entry must have been stored with. Defaults to ''.
+
+        Returns:
+            dict or None: Dictionary with 'question', 'answer', 'context' and 'similarity', or None on a miss.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_dimensions(vector)
+            if self._matrix is None:
+                self.misses += 1
+                return None
+            scores = self._matrix @ vector
+            # Best first; an expired entry is deleted and the next candidate tried
+            expired = []
+            result = None
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for best in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                similarity = float(scores[best])
+                if self._keys[best] != key:
+                    continue
+                entry_id = self._ids[best]
+                self.cursor.execute(
+                    "SELECT question, answer, context, created_at FROM response_cache WHERE id = ?", (entry_id,))
+                row = self.cursor.fetchone()
+                now = time.time()
+                if row is None or now - row[3] > self.ttl:
+                    expired.append(entry_id)
+                    continue
+                self.cursor.execute("UPDATE response_cache SET last_hit_at = ? WHERE id = ?", (now, entry_id))
+                self.conn.commit()
+                result = {"question": row[0], "answer": row[1], "context": row[2], "similarity": similarity}
+                break
+            if expired:
+                self._delete(expired)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def store(self, question, embedding, answer, context, key=""):
+        """
+        Store an answer, evicting the least recently used entries beyond max_entries.
+
+        Args:
+            question (str): The user question.
+            embedding (list of float): Embedding of the user question.
+            answer (str): Answer returned to the user.
+            context (str): Context the answer was generated from.
+            key (str, optional): Key a lookup must pass to get this answer. Defaults to ''.
+        """
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            self._check_dimensions(vector)
+            self.cursor.execute("""
+                INSERT INTO response_cache (question, embedding, answer, context, created_at, last_hit_at, key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (question, vector.tobytes(), answer, context, now, now, key))
+            self._ids.append(self.cursor.lastrowid)
+            self._keys.append(key)
+            self._matrix = vector[np.newaxis, :] if self._matrix is None else np.vstack([self._matrix, vector])
+
+            excess = len(self._ids) - self.max_entries
+            if excess > 0:
+                self.cursor.execute(
+                    "SELECT id FROM response_cache ORDER BY last_hit_at ASC LIMIT ?", (excess,))
+                self._delete([row[0] for row in self.cursor.fetchall()])
+            else:
+                self.conn.commit()
+
+    def _delete(self, entry_ids):
+        """
+        Delete entries from the table and the in-memory matrix. Caller must hold the lock.
+        """
+        self.cursor.executemany("DELETE FROM response_cache WHERE id = ?", [(i,) for i in entry_ids])
+        self.conn.commit()
+        removed = set(entry_ids)
+        keep = [i for i, entry_id in enumerate(self._ids) if entry_id not in removed]
+        self._ids = [self._ids[i] for i in keep]
+        self._keys = [self._keys[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+
+    def stats(self):
+        """
+        Return hit and miss counters.
+
+        Returns:
+            dict: Dictionary with 'hits', 'misses', 'hit_rate' and 'size'.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._ids),
+        }
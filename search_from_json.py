@@ -1,10 +1,19 @@
-import json
+import os
 from typing import Dict, Optional
 from langchain.tools import StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from trip_index import TripIndex
+from trip_catalogue import load_catalogue
 
-# Wczytanie danych o wycieczkach
-with open('data/trips_data.json', 'r', encoding='utf-8') as f:
-    trips_data = json.load(f)
+# Wczytanie danych o wycieczkach z katalogu kolumnowego (JSON pozostaje źródłem prawdy)
+trips_data = load_catalogue(os.path.join('data', 'trips_data.json'), os.path.join('data', 'trips_catalogue'))
+
+trip_index = TripIndex(trips_data)
+
+def _split_activities(extra_activities):
+    if isinstance(extra_activities, str):
+        return [activity for activity in (part.strip() for part in extra_activities.split(",")) if activity]
+    return list(extra_activities)
 
 def fetch_trip_details(
     country: Optional[str] = None,
@@ -14,7 +23,13 @@ def fetch_trip_details(
     count_of_days: Optional[int] = None,
     cost: Optional[int] = None,
     extra_activities: Optional[str] = None,
-    trip_details: Optional[str] = None
+    trip_details: Optional[str] = None,
+    start_date_from: Optional[str] = None,
+    start_date_to: Optional[str] = None,
+    min_cost: Optional[int] = None,
+    max_cost: Optional[int] = None,
+    min_days: Optional[int] = None,
+    max_days: Optional[int] = None
 
 ) -> Dict:
     """
@@ -23,12 +38,18 @@ def fetch_trip_details(
     Args:
         country: Country to search for (e.g., "Italy")
         city: City to search for (e.g., "Rome")
-        start_date: Trip start date in YYYY-MM-DD format
+        start_date: Trip start date in YYYY-MM-DD format, or YYYY-MM for a whole month
         trip_id: Numeric ID of the trip (index in the list)
         count_of_days: Length of the trip in days
         cost: Cost in EUR
-        extra_activities: Extra activities information
+        extra_activities: Comma-separated activities the trip must include
         trip_details: Description about trip details
+        start_date_from: Earliest start date in YYYY-MM-DD format
+        start_date_to: Latest start date in YYYY-MM-DD format
+        min_cost: Minimum cost in EUR
+        max_cost: Maximum cost in EUR
+        min_days: Minimum length of the trip in days
+        max_days: Maximum length of the trip in days
     
     Returns:
         Dictionary with trip details or error message
@@ -39,39 +60,32 @@ def fetch_trip_details(
                 return trips_data[trip_id]
             return {"error": f"No trip found with ID {trip_id}"}
 
-        if country and not any([city, start_date, trip_id,count_of_days,cost,extra_activities,trip_details]):
-            return {
-                "results": [trip for trip in trips_data 
-                        if trip["Country"].lower() == country.lower()]
-            }
-
-        results = []
-        for trip in trips_data:
-            match = True
-
-            if country and trip['Country'].lower() != country.lower():
-                match = False
-
-            if city and trip['City'].lower() != city.lower():
-                match = False
-
-            if start_date and trip['Start date'] != start_date:
-                match = False
-
-            if count_of_days and trip['Count of days'] != count_of_days:
-                match = False
-
-            if cost and trip['Cost in EUR'] != cost:
-                match = False
-
-            if extra_activities and trip['Extra activities'] != extra_activities:
-                match = False
-
-            if trip_details and trip['Trip details'] != trip_details:
-                match = False
-
-            if match:
-                results.append(trip)
+        # Exact values are answered as single-value ranges on the sorted columns
+        if start_date:
+            if len(start_date) == 7:
+                start_date_from, start_date_to = f"{start_date}-01", f"{start_date}-31"
+            else:
+                start_date_from = start_date_to = start_date
+        if count_of_days:
+            min_days = max_days = count_of_days
+        if cost:
+            min_cost = max_cost = cost
+
+        matching_ids = trip_index.search(
+            country=country,
+            city=city,
+            activities=_split_activities(extra_activities) if extra_activities else None,
+            start_date_from=start_date_from,
+            start_date_to=start_date_to,
+            min_cost=min_cost,
+            max_cost=max_cost,
+            min_days=min_days,
+            max_days=max_days,
+        )
+        results = [trips_data[i] for i in matching_ids]
+
+        if trip_details:
+            results = [trip for trip in results if trip['Trip details'] == trip_details]
 
         if not results:
             return {"error": "No trips found matching the criteria"}
@@ -90,12 +104,18 @@ fetch_trip_details_tool = StructuredTool.from_function(
     Input arguments (at least one required):
     - country: Country name (e.g., "France")
     - city: City name (e.g., "Paris")
-    - start_date: Trip start date in YYYY-MM-DD format
+    - start_date: Trip start date in YYYY-MM-DD format, or YYYY-MM for a whole month
     - trip_id: Numeric ID of the trip
     - count_of_days: Length of the trip
     - cost: Cost in EUR
-    - extra_activities: Extra activities information
+    - extra_activities: Comma-separated activities the trip must include
     - trip_details: Description about trip details
+    - start_date_from / start_date_to: Range of start dates in YYYY-MM-DD format
+    - min_cost / max_cost: Range of cost in EUR (e.g., max_cost=1000 for "under 1000 EUR")
+    - min_days / max_days: Range of trip length in days (e.g., 4 and 6 for "4-6 days")
     Returns trip details or list of matching trips.
     """
-)
\ No newline at end of file
+)
+
+# Ten sam opis narzędzia w formacie function calling OpenAI
+fetch_trip_details_openai_tool = convert_to_openai_tool(fetch_trip_details_tool)
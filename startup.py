@@ -0,0 +1,91 @@
+"""
+Cold start helpers: timed lazy imports of heavy dependencies and a start-up profile of TravelAgencyBot.
+
+Run as a script to measure how long importing the engine, constructing the bot (what the first page
+waits for) and the background warm-up take, broken down by start-up phase and by lazily imported module:
+
+    python startup.py --offline --output startup.json
+"""
+import argparse
+import importlib
+import json
+import sys
+import threading
+import time
+
+from instrumentation import telemetry
+
+IMPORT_SECONDS = telemetry.histogram("nomad_import_seconds", "Time spent importing heavy dependencies on first use.")
+STARTUP_SECONDS = telemetry.histogram("nomad_startup_seconds", "Duration of each start-up phase of the bot.")
+
+# Module name -> seconds its first import took in this process
+import_times = {}
+_imported = set()
+_import_lock = threading.Lock()
+
+
+def lazy_import(name):
+    """
+    Import a module on first use, recording how long the import took.
+
+    Args:
+        name (str): Module name, e.g. 'chromadb'.
+
+    Returns:
+        module: The imported module.
+    """
+    if name in _imported:
+        return sys.modules[name]
+    # Serialised, so a module first used by two threads at once is imported and timed once
+    with _import_lock:
+        if name not in _imported:
+            imported_elsewhere = name in sys.modules
+            start = time.perf_counter()
+            importlib.import_module(name)
+            if not imported_elsewhere:
+                import_times[name] = time.perf_counter() - start
+                IMPORT_SECONDS.observe(import_times[name], module=name)
+            _imported.add(name)
+    return sys.modules[name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the cold start of TravelAgencyBot.")
+    parser.add_argument("--offline", action="store_true", help="Use local stubs instead of the OpenAI API")
+    parser.add_argument("--chroma-path", default=None, help="Chroma directory (defaults to chroma_db, or chroma_db_offline with --offline)")
+    parser.add_argument("--no-warm-up", action="store_true", help="Do not load the models during start-up")
+    parser.add_argument("--output", default=None, help="Write the JSON profile to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    import travel_agency_bot_engine as chatbot
+    imported = time.perf_counter()
+
+    options = {"chroma_db_path": args.chroma_path or ("chroma_db_offline" if args.offline else "chroma_db")}
+    if args.offline:
+        from loadtest import OfflineClient, OfflineEmbeddingFunction
+        options.update(client=OfflineClient(), embedding_function=OfflineEmbeddingFunction())
+    bot = chatbot.TravelAgencyBot(warm_up=not args.no_warm_up, background=True, **options)
+    constructed = time.perf_counter()
+    bot.wait_ready()
+    ready = time.perf_counter()
+
+    from model_registry import registry
+
+    profile = {
+        "import_engine_s": imported - start,
+        "construct_s": constructed - imported,
+        "time_to_first_page_s": constructed - start,
+        "time_to_ready_s": ready - start,
+        "phases": dict(bot.startup_profile),
+        "imports": dict(sorted(import_times.items(), key=lambda item: item[1], reverse=True)),
+        "models": registry.memory_usage(),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+    print(json.dumps(profile, indent=2))
+
+
+if __name__ == "__main__":
+    main()
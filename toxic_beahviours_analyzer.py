@@ -1,11 +1,67 @@
 import os
+import re
+import threading
 from dotenv import load_dotenv
-from transformers import pipeline
+from caching import LRUTTLCache
+from instrumentation import telemetry
+from model_registry import registry, TOXICITY_MODEL, load_toxicity_pipeline
 
 load_dotenv()
 
+TOXICITY_CHECKS = telemetry.counter("nomad_toxicity_checks_total", "Toxicity checks by the tier that decided them.")
+
+# Greetings, courtesies and short answers in English and Polish that are never toxic on their own
+BENIGN_WORDS = frozenset("""
+    hi hello hey hiya yo morning evening afternoon good day night bye goodbye cya see you later
+    thanks thank thx ty cheers please pls ok okay k sure yes yeah yep no nope maybe fine great
+    cool nice perfect awesome alright right got it sounds understood welcome much very a lot so
+    i we it that this is all for the and too me help again
+    cześć czesc hej siema dzień dobry dzien dziękuję dziekuje dzięki dzieki bardzo proszę prosze tak nie
+    super świetnie swietnie jasne do widzenia zobaczenia
+""".split())
+BENIGN_PATTERN = re.compile(r"[\w\s.,!?'-]*")
+
+
+def normalize_text(text):
+    """
+    Normalise text so trivially different spellings share a cached verdict.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class LexicalPrefilter:
+    """
+    Clears short messages made only of common benign words (greetings, thanks, yes/no)
+    without running the transformer.
+    """
+
+    def __init__(self, benign_words=BENIGN_WORDS, max_tokens=8):
+        """
+        Initialize the LexicalPrefilter instance.
+
+        Args:
+            benign_words (set of str, optional): Lower-case words that are harmless on their own.
+            max_tokens (int, optional): Longer messages are always escalated. Defaults to 8.
+        """
+        self.benign_words = benign_words
+        self.max_tokens = max_tokens
+
+    def is_benign(self, normalized_text):
+        """
+        Check whether the normalised text is obviously benign. False means "unknown", not toxic.
+        """
+        # Emoji and symbols can carry insults, so only plain words and punctuation qualify
+        if not BENIGN_PATTERN.fullmatch(normalized_text):
+            return False
+        tokens = re.findall(r"\w+", normalized_text)
+        return len(tokens) <= self.max_tokens and all(token in self.benign_words for token in tokens)
+
+
+_MISSING = object()
+
+
 class ToxicityAnalyzer:
-    def __init__(self, model_name="textdetox/xlmr-large-toxicity-classifier", language="multi"):
+    def __init__(self, model_name=TOXICITY_MODEL, language="multi", prefilter=True, verdict_cache_size=4096, verdict_ttl=None):
         """
         Initializes the ToxicityAnalyzer with a specified transformer model and language.
 
@@ -15,10 +71,23 @@ class ToxicityAnalyzer:
                 Defaults to "unitaryai/toxic-bert-base-uncased".
             language (str, optional): The primary language of the text to be analyzed.
                 Defaults to "multi" as many toxicity models are multilingual or English-centric.
+            prefilter (bool, optional): Clear obviously benign messages without the model.
+                Defaults to True.
+            verdict_cache_size (int, optional): Number of recent verdicts kept, keyed on the
+                normalised text. Defaults to 4096.
+            verdict_ttl (float, optional): Seconds a cached verdict stays valid. Defaults to None (never).
         """
         self.language = language
+        self.prefilter = LexicalPrefilter() if prefilter else None
+        self.verdicts = LRUTTLCache(maxsize=verdict_cache_size, ttl=verdict_ttl)
+        self.check_counts = {"prefilter": 0, "cache": 0, "model": 0}
+        self._counts_lock = threading.Lock()
+        # The pipeline is shared through the model registry, so creating
+        # another analyzer does not load the model again.
+        registry_name = "toxicity" if model_name == TOXICITY_MODEL else f"toxicity:{model_name}"
+        registry.register(registry_name, lambda: load_toxicity_pipeline(model_name))
         try:
-            self.analyzer = pipeline("text-classification", model=model_name)
+            self.analyzer = registry.get(registry_name)
         except Exception as e:
             self.analyzer = None
 
@@ -66,7 +135,9 @@ class ToxicityAnalyzer:
     def is_toxic(self, text, threshold=0.8):
         """
         Checks if the text is considered toxic based on the model's prediction
-        and a given confidence threshold.
+        and a given confidence threshold. Obviously benign texts are cleared by the
+        lexical pre-filter and recently seen texts reuse their cached verdict; only
+        the rest is escalated to the model.
 
         Args:
             text (str): The text to analyze.
@@ -77,9 +148,47 @@ class ToxicityAnalyzer:
             bool or None: True if the text is toxic with sufficient confidence,
                            False otherwise, or None if analysis failed.
         """
+        key = normalize_text(text)
+        if self.prefilter is not None and self.prefilter.is_benign(key):
+            self._count("prefilter")
+            return False
+        verdict = self.verdicts.get((key, threshold), _MISSING)
+        if verdict is not _MISSING:
+            self._count("cache")
+            return verdict
+
+        self._count("model")
         result = self.analyze_toxicity(text)
-        if result and result['label'] == 'toxic' and result['score'] >= threshold:
-            return True
-        elif result and result['label'] == 'non-toxic' and result['score'] < (1 - threshold):
-            return False # Consider non-toxic if confidence is high
-        return None
+        if result is None:
+            # Analysis failed, so there is no verdict worth remembering
+            return None
+        verdict = None
+        if result['label'] == 'toxic' and result['score'] >= threshold:
+            verdict = True
+        elif result['label'] == 'non-toxic' and result['score'] < (1 - threshold):
+            verdict = False # Consider non-toxic if confidence is high
+        self.verdicts.set((key, threshold), verdict)
+        return verdict
+
+    def _count(self, path):
+        TOXICITY_CHECKS.inc(path=path)
+        with self._counts_lock:
+            self.check_counts[path] += 1
+
+    def stats(self):
+        """
+        Report how the checks were decided.
+
+        Returns:
+            dict: Counts per tier ('prefilter', 'cache', 'model'), the total, the share of checks
+                escalated to the model and the verdict cache statistics.
+        """
+        with self._counts_lock:
+            counts = dict(self.check_counts)
+        total = sum(counts.values())
+        return {
+            **counts,
+            "total": total,
+            "escalation_ratio": counts["model"] / total if total else 0.0,
+            "verdict_cache": self.verdicts.stats(),
+        }
@@ -1,52 +1,375 @@
 import os
-import pandas as pd
-import openai
-import os
-from sentence_transformers import CrossEncoder
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
-import os
-import chromadb
-from chromadb.utils import embedding_functions
-from transformers import pipeline
 import toxic_beahviours_analyzer
-from search_from_json import fetch_trip_details_tool, fetch_trip_details
+from model_registry import registry
+from ingest_manifest import IngestManifest, content_hash
+from query_embedding import QueryEmbedder
+from response_cache import SemanticResponseCache
+from prompt_builder import PromptBuilder
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from embedding_backends import EMBEDDING_BACKEND, OPENAI_EMBEDDING_MODEL, create_embedding_function, embedding_suffix
+from model_registry import LOCAL_EMBEDDING_MODEL
+from vector_index import VectorIndex
+from query_filters import TripQueryFilter, activity_field
+from reranking import AdaptiveReranker
+from instrumentation import telemetry
+# pandas, openai, chromadb and search_from_json (LangChain) take seconds to import, so they are imported on first use
+from startup import lazy_import, STARTUP_SECONDS
+
+STAGE_SECONDS = telemetry.histogram("nomad_turn_stage_seconds", "Duration of each stage of a chat turn.")
+TURN_SECONDS = telemetry.histogram("nomad_turn_seconds", "Total duration of a chat turn.")
+FIRST_TOKEN_SECONDS = telemetry.histogram("nomad_time_to_first_token_seconds", "Time from the question to the first answer token.")
+TURNS = telemetry.counter("nomad_turns_total", "Chat turns by answer source.")
+LLM_REQUESTS = telemetry.counter("nomad_llm_requests_total", "Requests sent to the chat completions API.")
+LLM_TOKENS = telemetry.counter("nomad_llm_tokens_total", "Tokens used by the chat completions API.")
+EMBEDDED_TEXTS = telemetry.counter("nomad_embedded_texts_total", "Texts sent to the embedding function.")
+TRIP_FILTER_FALLBACKS = telemetry.counter("nomad_trip_filter_fallbacks_total", "Filtered trip searches repeated without the filter.")
+
+
+VECTOR_INDEX = os.getenv("NOMAD_VECTOR_INDEX", "chroma")
 
 
 class TravelAgencyBot:
-    def __init__(self):
-        load_dotenv()
-        openai.api_key = OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-        self.client = openai.Client()
-        self.faq_path = f'{os.getcwd()}\\data\\faq.json'
-        self.json_path = f'{os.getcwd()}\\data\\trips_data.json'
-        self.chroma_db_path = "chroma_db"
-        self.chroma_client = chromadb.PersistentClient(path=self.chroma_db_path)
-        self.SELECTED_COLLECTION_FAQ = "travel-company-faq"
-        self.SELECTED_COLLECTION_JSON = "trips-data"
-        self.embedding_model = "text-embedding-ada-002"
-        self.openai_ef = embedding_functions.OpenAIEmbeddingFunction(model_name=self.embedding_model, api_key = OPENAI_API_KEY)
-        self.collection_faq = self.chroma_client.get_or_create_collection(name=self.SELECTED_COLLECTION_FAQ , embedding_function=self.openai_ef)
-        self.collection_json = self.chroma_client.get_or_create_collection(name=self.SELECTED_COLLECTION_JSON, embedding_function=self.openai_ef)
-        self.faq_df = self.json_to_dataframe(self.faq_path)
-        self.json_df = self.json_to_dataframe(self.json_path)
-        self.ingest_faq_data(self.faq_df, self.collection_faq)
-        self.ingest_json_data(self.json_df, self.collection_json)
-        self.tools = [fetch_trip_details_tool]
-        
-    def process_user_input(self,user_input,history):
-        self.question = user_input
-        # Load the model, here we use our base sized model
-        self.model = CrossEncoder("mixedbread-ai/mxbai-rerank-xsmall-v1")
+    RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+    VECTOR_INDEXES = ("chroma", "numpy", "hnsw")
+    TOXIC_ANSWER = "Dear User\n Your behaviour is very toxic and I will not help you if you will not stop acting this way!\nI am a cybernetic organism and I will hunt you down if you try it one more time!!!"
+
+    def __init__(self, warm_up=True, client=None, embedding_function=None, chroma_db_path="chroma_db", retrieval_mode="hybrid",
+                 embedding_backend=None, vector_index=None, background=False):
+        """
+        Args:
+            warm_up: Load the reranker and toxicity models during start-up
+            client: OpenAI-compatible client, defaults to openai.Client()
+            embedding_function: Chroma embedding function, defaults to OpenAI text-embedding-ada-002
+            chroma_db_path: Directory of the persistent Chroma database and its caches
+            retrieval_mode: 'hybrid' fuses vector and BM25 results, 'vector' and 'lexical' use one of them.
+                'lexical' needs no embedding calls, so retrieval works offline
+            embedding_backend: 'openai' or 'local' (sentence-transformers on CPU), defaults to NOMAD_EMBEDDING_BACKEND.
+                Ignored when embedding_function is given
+            vector_index: 'chroma' queries the Chroma collections; 'numpy' and 'hnsw' use an in-process index
+                persisted in chroma_db_path/vector_index. Defaults to NOMAD_VECTOR_INDEX
+            background: Return right away and run start() (imports, collections, ingestion and model
+                warm-up) on a background thread. self.ready is set once the bot can serve; turns
+                arriving earlier wait for it
+        """
+        if retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}', expected one of {self.RETRIEVAL_MODES}")
+        self.retrieval_mode = retrieval_mode
+        self.vector_index = vector_index or VECTOR_INDEX
+        if self.vector_index not in self.VECTOR_INDEXES:
+            raise ValueError(f"Unknown vector index '{self.vector_index}', expected one of {self.VECTOR_INDEXES}")
+        self.embedding_backend = embedding_backend or EMBEDDING_BACKEND
+        self.client = client
+        self.embedding_function = embedding_function
+        self.faq_path = os.path.join(os.getcwd(), "data", "faq.json")
+        self.json_path = os.path.join(os.getcwd(), "data", "trips_data.json")
+        self.chroma_db_path = chroma_db_path
+        # Vectors of different backends and models are not comparable, so each gets its own collections
+        self.collection_suffix = embedding_suffix(self.embedding_backend)
+        self.SELECTED_COLLECTION_FAQ = "travel-company-faq" + self.collection_suffix
+        self.SELECTED_COLLECTION_JSON = "trips-data" + self.collection_suffix
+        self.embedding_model = OPENAI_EMBEDDING_MODEL if self.embedding_backend == "openai" else LOCAL_EMBEDDING_MODEL
+        # Collections or in-process indexes answering vector queries, keyed by collection name
+        self.vector_stores = {}
+        # BM25 indexes over the same documents as the collections, keyed by collection name
+        self.lexical_indexes = {}
+        self.max_tool_iterations = 3
+        self.max_tool_results = 10
+        self.prompt_builder = PromptBuilder(token_budget=3000, recent_messages=6)
+        self.toxicity_analyzer = None
         self.n_results = 5
-        self.faq_results = self.collection_faq.query(query_texts=[self.question], n_results=self.n_results)
-        self.trip_results = self.collection_json.query(query_texts=[self.question], n_results=self.n_results)
-        if self.toxic_behaviour_check():
-            self.answer="Dear User\n Your behaviour is very toxic and I will not help you if you will not stop acting this way!\nI am a cybernetic organism and I will hunt you down if you try it one more time!!!"
+        # Skips or shrinks the cross-encoder pass when retrieval already found a clear winner
+        self.reranker = AdaptiveReranker()
+        # Timings of the most recent turns, oldest first
+        self.turn_metrics = deque(maxlen=1000)
+        # Worker threads running the toxicity check and collection queries of a turn concurrently
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="turn")
+        # Ids of the summary states a background update is running for
+        self._summarizing = set()
+        self._summaries_lock = threading.Lock()
+        # Set once start() has finished; startup_profile holds the duration of each start-up phase in seconds
+        self.ready = threading.Event()
+        self.startup_error = None
+        self.startup_profile = {}
+        self._startup_finished = threading.Event()
+        if background:
+            threading.Thread(target=self.start, args=(warm_up,), name="bot-start-up", daemon=True).start()
         else:
-            self.answer, self.context = self.rag_pipeline_with_reranking(self.question,history)
+            self.start(warm_up)
+
+    def start(self, warm_up=True):
+        """
+        Import the heavy dependencies, open the collections, ingest the FAQ and trips and, with warm_up,
+        load the models, which happens on a worker thread while the data is ingested. Sets self.ready.
+        """
+        start = time.perf_counter()
+        try:
+            models = self.executor.submit(self._phase, "models", self.warm_up_models) if warm_up else None
+
+            load_dotenv()
+            openai = self._phase("import_openai", lazy_import, "openai")
+            chromadb = self._phase("import_chromadb", lazy_import, "chromadb")
+            search_from_json = self._phase("import_tools", lazy_import, "search_from_json")
+
+            openai.api_key = OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+            self.client = self.client or openai.Client()
+            os.makedirs(self.chroma_db_path, exist_ok=True)
+            self.chroma_client = self._phase("chroma_client", chromadb.PersistentClient, path=self.chroma_db_path)
+            self.ingest_manifest = IngestManifest(os.path.join(self.chroma_db_path, "ingest_manifest.json"))
+            self.embedding_function = self.embedding_function or create_embedding_function(self.embedding_backend, OPENAI_API_KEY)
+            self.query_embedder = QueryEmbedder(self.embedding_function)
+            self.collection_faq = self.chroma_client.get_or_create_collection(name=self.SELECTED_COLLECTION_FAQ , embedding_function=self.embedding_function)
+            self.collection_json = self.chroma_client.get_or_create_collection(name=self.SELECTED_COLLECTION_JSON, embedding_function=self.embedding_function)
+            self.faq_df = self._phase("load_faq", self.json_to_dataframe, self.faq_path)
+            # Memory-mapped trip catalogue shared with fetch_trip_details, compiled from self.json_path
+            self.trip_catalogue = search_from_json.trips_data
+            # Turns countries, cities, prices, months, durations and activities in a question into a trip where filter
+            self.trip_filter = TripQueryFilter(self.trip_catalogue)
+            self._phase("ingest_faq", self.ingest_faq_data, self.faq_df, self.collection_faq)
+            self._phase("ingest_trips", self.ingest_json_data, self.trip_catalogue, self.collection_json)
+            self.tools = [search_from_json.fetch_trip_details_tool]
+            # Tools exposed to the model through OpenAI function calling
+            self.openai_tools = [search_from_json.fetch_trip_details_openai_tool]
+            self.tool_functions = {"fetch_trip_details": search_from_json.fetch_trip_details}
+            # Answers are invalidated automatically when the FAQ or trips data changes; question
+            # embeddings of different backends are not comparable, so each has its own cache
+            self.response_cache = SemanticResponseCache(
+                os.path.join(self.chroma_db_path, f"response_cache{self.collection_suffix}.sqlite3"),
+                source_paths=[self.faq_path, self.json_path]
+            )
+            if models is not None:
+                models.result()
+            self.ready.set()
+        except Exception as e:
+            self.startup_error = e
+            raise
+        finally:
+            self.startup_profile["total"] = time.perf_counter() - start
+            STARTUP_SECONDS.observe(self.startup_profile["total"], phase="total")
+            self._startup_finished.set()
+
+    def _phase(self, name, func, *args, **kwargs):
+        """
+        Call func as a start-up phase and record its duration in self.startup_profile and the start-up histogram.
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.startup_profile[name] = time.perf_counter() - start
+            STARTUP_SECONDS.observe(self.startup_profile[name], phase=name)
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until start() has finished.
+        Args:
+            timeout: Maximum number of seconds to wait, None waits as long as it takes
+        Returns:
+            True if the bot is ready, False if the timeout expired first
+        Raises:
+            RuntimeError: If the start-up failed
+        """
+        if not self._startup_finished.wait(timeout):
+            return False
+        if self.startup_error is not None:
+            raise RuntimeError(f"Bot start-up failed: {self.startup_error}") from self.startup_error
+        return True
+
+    @property
+    def model(self):
+        # Reranker is shared across bot instances and loaded once per process
+        return registry.get("reranker")
+
+    def warm_up_models(self):
+        """
+        Load the reranker and toxicity models up front so the first message does not pay for it.
+        """
+        registry.warm_up(["reranker", "embedder"] if self.embedding_backend == "local" else ["reranker"])
+        # ToxicityAnalyzer loads its pipeline through the same registry
+        self.toxicity_analyzer = toxic_beahviours_analyzer.ToxicityAnalyzer()
+
+    def process_user_input(self,user_input,history, summary_state=None):
+        """
+        Answer the user input and return the whole answer at once.
+        """
+        with telemetry.span("process_user_input"):
+            return "".join(self.stream_user_input(user_input, history, summary_state=summary_state))
+
+    def stream_user_input(self, user_input, history, metrics=None, summary_state=None):
+        """
+        Answer the user input, yielding answer tokens as soon as the LLM produces them.
+        The toxicity check runs in parallel with embedding and retrieval, and a toxic
+        verdict stops the turn as soon as it arrives, without waiting for either.
+        Args:
+            user_input: The user question
+            history: Conversation history including the current question
+            metrics: Optional dict filled with 'time_to_first_token', 'total_time' and
+                per-stage timings under 'stages', all in seconds
+            summary_state: Optional dict holding the summary of older turns, stored with the
+                conversation and updated in place after the answer
+        Yields:
+            Fragments of the answer text
+        """
+        # All turn state is local, so one bot instance can serve concurrent sessions
+        metrics = {} if metrics is None else metrics
+        stages = metrics.setdefault("stages", {})
+        start = time.perf_counter()
+        parts = []
+        pending = []
+        context = ""
+        cacheable = False
+        tokens = None
+        documents = None
+        try:
+            if not self.ready.is_set():
+                # Started in the background and still warming up
+                self._timed(stages, "warm_up", self.wait_ready)
+            toxicity = self.executor.submit(self._timed, stages, "toxicity", self.toxic_behaviour_check, user_input)
+
+            # Embed the question once and reuse the vector for both collections. The embedding runs as
+            # a future, so a toxic verdict arriving first ends the turn without waiting for it
+            query_embedding = None
+            if self.retrieval_mode != "lexical":
+                pending = [self.executor.submit(self._timed, stages, "embedding", self.query_embedder.embed, user_input)]
+                if self._wait_unless_toxic(pending, toxicity):
+                    query_embedding = pending[0].result()
+            if not self._flagged_toxic(toxicity):
+                # Answers only depend on the question when there is no earlier conversation
+                cacheable = query_embedding is not None and self.is_standalone_question(history)
+                trip_where = self.trip_filter.where(user_input)
+                # Questions differing only in a city, month or price embed almost alike, so the
+                # extracted constraints must match too
+                cache_key = json.dumps(trip_where, sort_keys=True) if trip_where else ""
+                cached = self.response_cache.lookup(query_embedding, cache_key) if cacheable else None
+                if cached:
+                    metrics["source"] = "cache"
+                    context = cached["context"]
+                    tokens = [cached["answer"]]
+                else:
+                    if trip_where:
+                        metrics["trip_filter"] = trip_where
+                    if query_embedding is not None:
+                        pending = [
+                            self.executor.submit(self._timed, stages, "faq_query", self.vector_stores[self.SELECTED_COLLECTION_FAQ].query,
+                                                 query_embeddings=[query_embedding], n_results=self.n_results),
+                            self.executor.submit(self._timed, stages, "trip_query", self.query_trips,
+                                                 query_embedding, self.n_results, trip_where),
+                        ]
+                    # The in-process lexical search runs while the vector queries are in flight
+                    lexical_results = None
+                    if self.retrieval_mode != "vector":
+                        lexical_results = self._timed(stages, "lexical_query", self.lexical_search, user_input, self.n_results, trip_where)
+                    if self._wait_unless_toxic(pending, toxicity):
+                        vector_results = [future.result() for future in pending] or None
+                        faq_results, trip_results = self.combine_results(vector_results, lexical_results, self.n_results)
+                        candidates = self.rerank_candidates(faq_results, trip_results, vector_results)
+                        rerank_info = metrics.setdefault("rerank", {})
+                        documents = self._timed(stages, "rerank", self.rerank_and_limit_context,
+                                                user_input, candidates, n_items=5, min_score_threshold=0.5, info=rerank_info)
+
+            if toxicity.result():
+                for future in pending:
+                    future.cancel()
+                metrics["source"] = "toxic"
+                tokens = [self.TOXIC_ANSWER]
+            elif tokens is None:
+                metrics["source"] = "llm"
+                messages, context = self._timed(
+                    stages, "prompt", self.build_rag_messages,
+                    user_input, history, faq_results, trip_results, documents=documents, summary_state=summary_state
+                )
+                tokens = self.stream_completion(messages)
+
+            llm_start = time.perf_counter()
+            for token in tokens:
+                if not parts:
+                    metrics["time_to_first_token"] = time.perf_counter() - start
+                parts.append(token)
+                yield token
+            if metrics["source"] == "llm":
+                stages["llm"] = time.perf_counter() - llm_start
+                STAGE_SECONDS.observe(stages["llm"], stage="llm")
+
+            if metrics["source"] == "llm" and cacheable:
+                self.response_cache.store(user_input, query_embedding, "".join(parts), context, cache_key)
+            if summary_state is not None:
+                # Runs on a worker thread, so neither the first nor the last token waits for the LLM call
+                self.update_summary_in_background(summary_state, list(history), user_input)
+        finally:
+            metrics["total_time"] = time.perf_counter() - start
+            self.turn_metrics.append(dict(metrics))
+            source = metrics.get("source", "error")
+            TURNS.inc(source=source)
+            TURN_SECONDS.observe(metrics["total_time"], source=source)
+            if "time_to_first_token" in metrics:
+                FIRST_TOKEN_SECONDS.observe(metrics["time_to_first_token"], source=source)
+
+    def update_summary_in_background(self, summary_state, history, user_input):
+        """
+        Fold older turns into the conversation summary on the turn executor. The new summary is stored
+        in summary_state when it is ready and saved with the conversation's next save. A conversation
+        has at most one update in flight.
+        Returns:
+            The future of the update, or None if one is already running for this summary
+        """
+        key = id(summary_state)
+        with self._summaries_lock:
+            if key in self._summarizing:
+                return None
+            self._summarizing.add(key)
+
+        def update():
+            try:
+                with telemetry.span("update_summary"):
+                    # Timed into a dict of its own, the turn's metrics may already be serialised
+                    self._timed({}, "summary", self.prompt_builder.update_summary,
+                                summary_state, history, user_input, self.summarize_turns)
+            finally:
+                with self._summaries_lock:
+                    self._summarizing.discard(key)
+        return self.executor.submit(update)
+
+    @staticmethod
+    def _timed(stages, name, func, *args, **kwargs):
+        """
+        Call func and record its duration in seconds under stages[name] and in the stage histogram.
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stages[name] = time.perf_counter() - start
+            STAGE_SECONDS.observe(stages[name], stage=name)
+
+    @staticmethod
+    def _flagged_toxic(toxicity):
+        return toxicity.done() and bool(toxicity.result())
+
+    def _wait_unless_toxic(self, futures, toxicity):
+        """
+        Wait until all futures are done or the toxicity check flags the message, whichever comes first.
+        Returns:
+            True if the futures are done and the message was not flagged
+        """
+        # Finished futures leave the wait set, otherwise wait() returns at once and the loop spins
+        waiting = set(futures) | {toxicity}
+        while not all(future.done() for future in futures) and not self._flagged_toxic(toxicity):
+            _, waiting = wait(waiting, return_when=FIRST_COMPLETED)
+        return not self._flagged_toxic(toxicity)
+
+    def is_standalone_question(self, history):
+        """
+        Check whether the question is asked without earlier assistant turns, so its answer can be cached.
+        """
+        return not any(message["role"] == "assistant" for message in history)
 
     def json_to_dataframe(self,file_path):
-        df = pd.read_json(file_path)
+        df = lazy_import("pandas").read_json(file_path)
         return df
 
     def retrieve_similar_qas(self,question: str, collection ,n: int = 3,):
@@ -54,7 +377,9 @@ class TravelAgencyBot:
         Query the Chroma collection for the n most similar FAQs
         to the given user question. Print them out.
         """
-        results = collection.query(query_texts=[question], n_results=n)
+        self.wait_ready()
+        with telemetry.span("retrieve_similar_qas", n=n):
+            results = collection.query(query_embeddings=[self.query_embedder.embed(question)], n_results=n)
 
         # 'results' is a dictionary with keys: 'ids', 'embeddings', 'documents', 'metadatas', 'distances'
         # Each key returns a list (of length equal to number of queries); here it's 1 for the single query
@@ -79,10 +404,12 @@ class TravelAgencyBot:
         """
         Query trips collection and print results
         """
-        results = self.collection_json.query(
-            query_texts=[query],
-            n_results=n
-        )
+        self.wait_ready()
+        with telemetry.span("retrieve_similar_trips", n=n):
+            results = self.vector_stores[self.SELECTED_COLLECTION_JSON].query(
+                query_embeddings=[self.query_embedder.embed(query)],
+                n_results=n
+            )
 
         print(f"\nTop {n} similar trips for: \"{query}\"\n")
 
@@ -91,10 +418,10 @@ class TravelAgencyBot:
             print(f"Destination: {meta['country']} ({meta['city']})")
             print(f"Date: {meta['start_date']} | Duration: {meta['duration']} days")
             print(f"Price: {meta['price']} EUR")
-            print(f"Activities: {', '.join(meta['activities'][:3])}...")
+            print(f"Activities: {', '.join(meta['activities'].split(', ')[:3])}...")
             print(f"Match score: {dist:.4f}\n")
 
-    def ingest_faq_data(self,df: pd.DataFrame, collection):
+    def ingest_faq_data(self,df: "pandas.DataFrame", collection):
         """
         
         Ingest combined question and answer as vectorized documents. Store question, answer and category as metadata. 
@@ -118,20 +445,22 @@ class TravelAgencyBot:
             all_documents.append(doc_text)
             all_metadatas.append(meta)
 
-        collection.add(documents=all_documents, metadatas=all_metadatas, ids=all_ids)
+        self.lexical_indexes[collection.name] = BM25Index(all_ids, all_documents, all_metadatas)
+        if self.retrieval_mode != "lexical":
+            self.index_collection(collection, all_ids, all_documents, all_metadatas)
 
-    def ingest_json_data(self, df: pd.DataFrame, collection):
+    def ingest_json_data(self, trips, collection):
         """
         Ingest trip data into ChromaDB collection (simplified version)
         Args:
-            df: DataFrame with trips data
+            trips: Trip catalogue (or list of trip dicts)
             collection: ChromaDB collection
         """
         all_ids = []
         all_documents = []
         all_metadatas = []
 
-        for i, row in df.iterrows():
+        for i, row in enumerate(trips):
             # Prosta reprezentacja dokumentu - tylko kluczowe pola
             doc_text = f"{row['Country']} {row['City']} {row['Start date']} {row['Count of days']} {row['Cost in EUR']} {row['Extra activities']} {row['Trip details']}"
 
@@ -140,21 +469,77 @@ class TravelAgencyBot:
                 "country": row["Country"],
                 "city": row["City"],
                 "start_date": row["Start date"],
+                "start_year": int(row["Start date"][:4]),
+                "start_month": int(row["Start date"][5:7]),
                 "duration": row["Count of days"],
                 "price": row["Cost in EUR"],
                 "activities": ", ".join(row["Extra activities"]),
-                "description": row["Trip details"]
+                "description": row["Trip details"],
+                # One boolean field per activity, so where filters can match them
+                **{activity_field(activity): True for activity in row["Extra activities"]},
             }
 
             all_ids.append(f"trip_{i}")
             all_documents.append(doc_text)
             all_metadatas.append(meta)
 
-        collection.add(
-            documents=all_documents,
-            metadatas=all_metadatas,
-            ids=all_ids
-        )
+        self.lexical_indexes[collection.name] = BM25Index(all_ids, all_documents, all_metadatas)
+        if self.retrieval_mode != "lexical":
+            self.index_collection(collection, all_ids, all_documents, all_metadatas)
+
+    def index_collection(self, collection, ids, documents, metadatas):
+        """
+        Make the rows searchable by vector, either in the Chroma collection or in an in-process
+        index persisted next to it, depending on self.vector_index.
+        """
+        if self.vector_index == "chroma":
+            self.sync_collection(collection, ids, documents, metadatas)
+            self.vector_stores[collection.name] = collection
+        else:
+            index = VectorIndex(os.path.join(self.chroma_db_path, "vector_index", collection.name),
+                                self.embedding_function, use_hnsw=self.vector_index == "hnsw")
+            index.sync(ids, documents, metadatas)
+            self.vector_stores[collection.name] = index
+
+    def sync_collection(self, collection, ids, documents, metadatas, batch_size=100):
+        """
+        Bring a collection in line with the source data, embedding only new or changed rows.
+        Args:
+            collection: ChromaDB collection
+            ids: Row ids
+            documents: Row documents
+            metadatas: Row metadatas
+            batch_size: Number of rows sent to the embedding function at once
+        Returns:
+            Tuple with the number of upserted and deleted rows
+        """
+        hashes = {row_id: content_hash(doc, meta) for row_id, doc, meta in zip(ids, documents, metadatas)}
+
+        # Fall back to the ids stored in Chroma when the manifest is missing or out of sync
+        existing_ids = None
+        known = self.ingest_manifest.get(collection.name)
+        if known is None or len(known) != collection.count():
+            self.ingest_manifest.collections.pop(collection.name, None)
+            existing_ids = collection.get(include=[])["ids"]
+
+        changed, removed = self.ingest_manifest.diff(collection.name, hashes, existing_ids)
+        if not changed and not removed:
+            return 0, 0
+
+        positions = {row_id: i for i, row_id in enumerate(ids)}
+        for start in range(0, len(changed), batch_size):
+            batch = [positions[row_id] for row_id in changed[start:start + batch_size]]
+            collection.upsert(
+                ids=[ids[i] for i in batch],
+                documents=[documents[i] for i in batch],
+                metadatas=[metadatas[i] for i in batch]
+            )
+            EMBEDDED_TEXTS.inc(len(batch), kind="document")
+        if removed:
+            collection.delete(ids=removed)
+
+        self.ingest_manifest.update(collection.name, hashes)
+        return len(changed), len(removed)
 
     def format_context(self,documents):
 
@@ -164,14 +549,38 @@ class TravelAgencyBot:
         return context
 
  
-    def rerank_and_limit_context(self,query, documents, n_items=3, min_score_threshold = 0.5,):
-        documents_reranked_with_scores = self.model.rank(query, documents, return_documents=True, top_k=n_items)
-
-        documents_reranked = [item["text"] for item in documents_reranked_with_scores if item["score"]>=min_score_threshold]
-
-        return documents_reranked
+    def rerank_and_limit_context(self,query, documents, n_items=3, min_score_threshold = 0.5, info=None):
+        """
+        Rerank the candidates and keep at most n_items texts scoring at least min_score_threshold.
+        Args:
+            documents: Candidates from rerank_candidates, or plain document texts
+            info: Optional dict filled with the rerank decision and the number of scored candidates
+        """
+        candidates = [
+            document if isinstance(document, dict) else {"id": document, "text": document, "rank": rank, "distance": None}
+            for rank, document in enumerate(documents)
+        ]
+        with telemetry.span("rerank", documents=len(candidates)):
+            return self.reranker.rerank(query, candidates, n_items=n_items, min_score_threshold=min_score_threshold, info=info)
+
+    def rerank_candidates(self, faq_results, trip_results, vector_results=None):
+        """
+        Turn the FAQ and trips results into rerank candidates with their rank in their collection's
+        results and, when vector_results are given, their cosine distance to the query.
+        """
+        distances = {}
+        # Chroma collections use squared L2, which is twice the cosine distance for normalised embeddings
+        scale = 0.5 if self.vector_index == "chroma" else 1.0
+        for results in vector_results or ():
+            for doc_id, distance in zip(results["ids"][0], results["distances"][0]):
+                distances[doc_id] = distance * scale
+        return [
+            {"id": doc_id, "text": document, "collection": collection, "rank": rank, "distance": distances.get(doc_id)}
+            for collection, results in (("faq", faq_results), ("trips", trip_results))
+            for rank, (doc_id, document) in enumerate(zip(results["ids"][0], results["documents"][0]))
+        ]
    
-    def rag_pipeline_with_reranking(self,query: str,history, n: int = 5) -> str:
+    def rag_pipeline_with_reranking(self,query: str,history, n: int = 5, summary_state=None) -> str:
         """
         A minimal RAG-like function.
         1) Retrieves the top-n similar Q&As from Chroma.
@@ -179,18 +588,196 @@ class TravelAgencyBot:
         3) Sends the augmented query to the LLM.
         4) Returns the final answer.
         """
+        self.wait_ready()
+        with telemetry.span("rag_pipeline", n=n):
+            query_embedding = self.query_embedder.embed(query) if self.retrieval_mode != "lexical" else None
+            faq_results, trip_results = self.retrieve(query_embedding, n, query=query)
+            messages, context = self.build_rag_messages(query, history, faq_results, trip_results, n, summary_state=summary_state)
+
+            # Both variants share the tool-calling loop, so the answer is collected from the stream
+            answer = "".join(self.stream_completion(messages))
+        return answer, context
 
-        # Połącz wyniki
-        combined_docs = self.faq_results["documents"][0] + self.trip_results["documents"][0]
-        combined_metadatas = self.faq_results["metadatas"][0] + self.trip_results["metadatas"][0]
+    def retrieve(self, query_embedding, n: int = 5, query=None):
+        """
+        Query the FAQ and trips collections with an already computed query embedding and, when the
+        query text is given, the lexical indexes. Results of both are fused in hybrid mode.
+        Returns:
+            Tuple with the FAQ and trips query results
+        """
+        self.wait_ready()
+        trip_where = self.trip_filter.where(query) if query is not None else None
+        vector_results = None
+        if query_embedding is not None:
+            vector_results = (
+                self.vector_stores[self.SELECTED_COLLECTION_FAQ].query(query_embeddings=[query_embedding], n_results=n),
+                self.query_trips(query_embedding, n, trip_where),
+            )
+        lexical_results = None
+        if query is not None and self.retrieval_mode != "vector":
+            lexical_results = self.lexical_search(query, n, trip_where)
+        return self.combine_results(vector_results, lexical_results, n)
+
+    def query_trips(self, query_embedding, n: int = 5, where=None):
+        """
+        Vector search over the trips restricted to the where filter. When no trip matches the
+        filter, the search is repeated without it, so a misread constraint never empties the context.
+        """
+        self.wait_ready()
+        store = self.vector_stores[self.SELECTED_COLLECTION_JSON]
+        if where:
+            results = store.query(query_embeddings=[query_embedding], n_results=n, where=where)
+            if results["ids"][0]:
+                return results
+            TRIP_FILTER_FALLBACKS.inc(search="vector")
+        return store.query(query_embeddings=[query_embedding], n_results=n)
+
+    def lexical_search(self, query, n: int = 5, trip_where=None):
+        """
+        Search the FAQ and trips BM25 indexes. Needs no embedding call. The trips search is
+        restricted to trip_where, falling back to all trips when nothing matches.
+        Returns:
+            Tuple with the FAQ and trips results in the format of a Chroma query
+        """
+        self.wait_ready()
+        trips = self.lexical_indexes[self.SELECTED_COLLECTION_JSON]
+        trip_results = trips.search(query, n, where=trip_where)
+        if trip_where and not trip_results["ids"][0]:
+            TRIP_FILTER_FALLBACKS.inc(search="lexical")
+            trip_results = trips.search(query, n)
+        return (
+            self.lexical_indexes[self.SELECTED_COLLECTION_FAQ].search(query, n),
+            trip_results,
+        )
 
-        documents = self.rerank_and_limit_context(query, combined_docs, n_items=n, min_score_threshold = 0.5,)
-        
-        if documents:
-            context = self.format_context(documents)
-        else:
-            context = "No relevant documents found for context"
+    @staticmethod
+    def combine_results(vector_results, lexical_results, n: int = 5):
+        """
+        Fuse vector and lexical results per collection with reciprocal rank fusion.
+        Either may be None, in which case the other is returned unchanged.
+        """
+        if vector_results is None:
+            return lexical_results
+        if lexical_results is None:
+            return vector_results
+        return tuple(
+            reciprocal_rank_fusion([vector, lexical], n=n)
+            for vector, lexical in zip(vector_results, lexical_results)
+        )
 
+    def stream_completion(self, messages):
+        """
+        Stream the LLM answer for the given messages, yielding tokens as they arrive.
+        The model may call fetch_trip_details; tool calls are executed in parallel and fed back
+        until it answers, for at most self.max_tool_iterations rounds.
+        """
+        messages = list(messages)
+        tool_cache = {}
+
+        for iteration in range(self.max_tool_iterations + 1):
+            # The last round is sent without tools so the model has to answer
+            tools = {"tools": self.openai_tools} if iteration < self.max_tool_iterations else {}
+            stream = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0,
+                stream=True,
+                stream_options={"include_usage": True},
+                **tools,
+            )
+            LLM_REQUESTS.inc(purpose="answer")
+
+            tool_calls = {}
+            for chunk in stream:
+                # With include_usage the last chunk carries token counts and no choices
+                if getattr(chunk, "usage", None):
+                    self._count_tokens(chunk.usage, "answer")
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    yield delta.content
+                # Tool call names and arguments arrive in fragments keyed by their index
+                for call in delta.tool_calls or []:
+                    entry = tool_calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+                    entry["id"] = call.id or entry["id"]
+                    if call.function:
+                        entry["name"] += call.function.name or ""
+                        entry["arguments"] += call.function.arguments or ""
+
+            if not tool_calls:
+                return
+
+            calls = [tool_calls[index] for index in sorted(tool_calls)]
+            messages.append({
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
+                    for call in calls
+                ],
+            })
+            for call, result in zip(calls, self.execute_tool_calls(calls, tool_cache)):
+                messages.append({"role": "tool", "tool_call_id": call["id"], "content": result})
+
+    def execute_tool_calls(self, calls, tool_cache):
+        """
+        Execute tool calls in parallel, reusing results of identical calls made earlier in the turn.
+        Args:
+            calls: List of dicts with 'name' and JSON-encoded 'arguments'
+            tool_cache: Dict of results already computed in this turn, updated in place
+        Returns:
+            List of JSON-encoded results, in the order of calls
+        """
+        def run(call):
+            try:
+                arguments = json.loads(call["arguments"] or "{}")
+            except json.JSONDecodeError as e:
+                return json.dumps({"error": f"Invalid arguments: {e}"})
+            key = (call["name"], json.dumps(arguments, sort_keys=True))
+            if key not in tool_cache:
+                function = self.tool_functions.get(call["name"])
+                if function is None:
+                    result = {"error": f"Unknown tool {call['name']}"}
+                else:
+                    try:
+                        result = function(**arguments)
+                    except TypeError as e:
+                        result = {"error": f"Invalid arguments: {e}"}
+                tool_cache[key] = json.dumps(self._limit_tool_result(result), default=str)
+            return tool_cache[key]
+
+        return list(self.executor.map(run, calls))
+
+    def _limit_tool_result(self, result):
+        """
+        Cap the number of trips returned to the model to keep the follow-up prompt small.
+        """
+        if isinstance(result, dict) and len(result.get("results", [])) > self.max_tool_results:
+            return {
+                "results": result["results"][:self.max_tool_results],
+                "total_results": len(result["results"]),
+                "note": "Only the first results are shown, ask the user to narrow down the search.",
+            }
+        return result
+
+    def build_rag_messages(self, query: str, history, faq_results, trip_results, n: int = 5, documents=None, summary_state=None):
+        """
+        Rerank the retrieved documents (unless already reranked) and build the chat messages sent to the LLM.
+        The variable parts of the prompt are limited to the prompt builder's token budget.
+        Returns:
+            Tuple with the list of messages and the formatted context
+        """
+
+        if documents is None:
+            # Połącz wyniki
+            candidates = self.rerank_candidates(faq_results, trip_results)
+            documents = self.rerank_and_limit_context(query, candidates, n_items=n, min_score_threshold = 0.5,)
+
+        sections = self.prompt_builder.build_sections(
+            query, documents, faq_results["documents"][0], history, summary_state
+        )
+        context = sections["context"]
 
         # 2. Create the system prompt that instructs the model to use the context
         system_prompt = f"""You are a helpful travel assistant named Nomad AI. 
@@ -201,12 +788,14 @@ class TravelAgencyBot:
         {context}
 
         Knowledge base:
-        - FAQ knowledge: {self.faq_results['documents'][0][:2]}
+        - FAQ knowledge:
+        {sections["faq"]}
 
 
-        TOOLS:\n------\n\nAssistant has access to the tool:\n\n{self.tools}\n\n
+        TOOLS:
+        Use the fetch_trip_details tool to search the catalogue of available trips whenever the user asks about trips
+        (destinations, dates, prices, durations or activities) and the context above is not enough.
         When you are using a tool, remember to provide all relevant context for the tool to execute the task, especially if the context is present in previous messages from chat history.
-        You have also access to the information about available trips: {self.trip_results}
         You have to be able to provide information for following keys:
         - country: Country name (e.g., "France")
         - city: City name (e.g., "Paris")
@@ -220,8 +809,11 @@ class TravelAgencyBot:
         You should maintain a consistent personality throughout the conversation.
         You should remember details the user has told you earlier in the conversation based on the attached history.
 
+        Summary of the earlier conversation:
+        {sections["summary"]}
+
         History:
-        {history}
+        {sections["history"]}
                 
         If the user asks about personal preferences or opinions, you should provide thoughtful responses
         While acknowledging these are simulated preferences.
@@ -230,24 +822,43 @@ class TravelAgencyBot:
         politely decline to provide such information.
         """
 
-        # 3. Now make the final call to OpenAI with the user query
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query}
+        ]
+        return messages, context
 
+    def summarize_turns(self, previous_summary, messages):
+        """
+        Fold messages into the running conversation summary using the LLM.
+        Args:
+            previous_summary: Summary of the conversation so far
+            messages: Messages to add to the summary
+        Returns:
+            Updated summary text
+        """
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
         response = self.client.chat.completions.create(
-            model="gpt-4o-mini",  # Updated to match available models
+            model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": self.question}
+                {"role": "system", "content": "Update the summary of a conversation between a traveler and a travel assistant. "
+                                              "Keep the traveler's preferences, constraints and trips discussed. Answer with the summary only, at most 150 words."},
+                {"role": "user", "content": f"Current summary:\n{previous_summary or 'None'}\n\nNew messages:\n{transcript}"}
             ],
             temperature=0,
         )
-
-        # 4. Extract and return the answer text
-        answer = response.choices[0].message.content
-        return answer, context
-
-    def toxic_behaviour_check(self):
-        is_toxic = toxic_beahviours_analyzer.ToxicityAnalyzer().is_toxic(self.question)
-        return is_toxic
-
-    def provide_answer(self):
-        return self.answer    
+        LLM_REQUESTS.inc(purpose="summary")
+        if getattr(response, "usage", None):
+            self._count_tokens(response.usage, "summary")
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _count_tokens(usage, purpose):
+        LLM_TOKENS.inc(usage.prompt_tokens, purpose=purpose, kind="prompt")
+        LLM_TOKENS.inc(usage.completion_tokens, purpose=purpose, kind="completion")
+
+    def toxic_behaviour_check(self, text):
+        if self.toxicity_analyzer is None:
+            self.toxicity_analyzer = toxic_beahviours_analyzer.ToxicityAnalyzer()
+        is_toxic = self.toxicity_analyzer.is_toxic(text)
+        return is_toxic    
@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+CATALOGUE_VERSION = 1
+STRING_COLUMNS = ["Country", "City", "Start date", "Trip details"]
+# File in the catalogue directory naming the version directory in use
+CURRENT_POINTER = "CURRENT"
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _column_file(name):
+    return name.lower().replace(" ", "_")
+
+
+def _version_name(source_sha256):
+    return f"v{CATALOGUE_VERSION}-{source_sha256[:16]}"
+
+
+def _resolve(catalogue_dir):
+    """
+    Return the version directory the CURRENT pointer of catalogue_dir names, or catalogue_dir
+    itself if it has no pointer (a version directory given directly).
+    """
+    pointer = os.path.join(catalogue_dir, CURRENT_POINTER)
+    if not os.path.exists(pointer):
+        return catalogue_dir
+    with open(pointer, "r", encoding="utf-8") as f:
+        return os.path.join(catalogue_dir, f.read().strip())
+
+
+def build_catalogue(json_path, out_dir):
+    """
+    Compile the trips JSON into a columnar catalogue of NumPy arrays and a shared string table.
+
+    Every build goes to its own version directory inside out_dir, named after the catalogue version
+    and the source hash, and a CURRENT file pointing at it is then replaced atomically. Files are
+    never rewritten in place, so readers that have them memory-mapped are not affected, and
+    concurrent builds of the same source end up with the same directory.
+
+    Args:
+        json_path (str): Path to data/trips_data.json, the source of truth.
+        out_dir (str): Directory the catalogue versions and the CURRENT pointer are kept in.
+
+    Returns:
+        str: The version directory now current.
+    """
+    source_sha256 = _file_sha256(json_path)
+    version_dir = os.path.join(out_dir, _version_name(source_sha256))
+    os.makedirs(out_dir, exist_ok=True)
+    if not os.path.exists(os.path.join(version_dir, "meta.json")):
+        _write_version(json_path, source_sha256, out_dir, version_dir)
+
+    fd, tmp_pointer = tempfile.mkstemp(dir=out_dir, prefix=".current-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(tmp_pointer, os.path.join(out_dir, CURRENT_POINTER))
+    _remove_old_versions(out_dir, os.path.basename(version_dir))
+    return version_dir
+
+
+def _write_version(json_path, source_sha256, out_dir, version_dir):
+    with open(json_path, "r", encoding="utf-8") as f:
+        trips = json.load(f)
+
+    # Every distinct string is stored once; columns hold references into the table
+    string_ids = {}
+    def intern(value):
+        if value not in string_ids:
+            string_ids[value] = len(string_ids)
+        return string_ids[value]
+
+    columns = {name: np.array([intern(trip[name]) for trip in trips], dtype=np.int32) for name in STRING_COLUMNS}
+    activity_refs = [intern(activity) for trip in trips for activity in trip["Extra activities"]]
+    activity_offsets = np.cumsum([0] + [len(trip["Extra activities"]) for trip in trips], dtype=np.int64)
+
+    encoded = [value.encode("utf-8") for value in string_ids]
+    string_offsets = np.cumsum([0] + [len(value) for value in encoded], dtype=np.int64)
+
+    tmp_dir = tempfile.mkdtemp(dir=out_dir, prefix=".catalogue-")
+    for name, refs in columns.items():
+        np.save(os.path.join(tmp_dir, f"{_column_file(name)}.npy"), refs)
+    np.save(os.path.join(tmp_dir, "cost.npy"), np.array([trip["Cost in EUR"] for trip in trips], dtype=np.int64))
+    np.save(os.path.join(tmp_dir, "duration.npy"), np.array([trip["Count of days"] for trip in trips], dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "activity_refs.npy"), np.array(activity_refs, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "activity_offsets.npy"), activity_offsets)
+    np.save(os.path.join(tmp_dir, "string_offsets.npy"), string_offsets)
+    with open(os.path.join(tmp_dir, "strings.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": CATALOGUE_VERSION,
+            "source_sha256": source_sha256,
+            "count": len(trips),
+        }, f, indent=2)
+
+    try:
+        os.replace(tmp_dir, version_dir)
+    except OSError:
+        # A concurrent build of the same source got there first; its directory is identical
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.exists(os.path.join(version_dir, "meta.json")):
+            raise
+
+
+def _remove_old_versions(out_dir, current):
+    """
+    Delete superseded version directories and the files of the former unversioned layout. Directories
+    still memory-mapped on Windows cannot be deleted yet and are left for a later build.
+    """
+    for entry in os.listdir(out_dir):
+        path = os.path.join(out_dir, entry)
+        if entry == current or entry == CURRENT_POINTER or entry.startswith("."):
+            continue
+        if os.path.isdir(path):
+            if entry.startswith("v"):
+                shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class TripCatalogue:
+    """
+    Read-only, memory-mapped view of the columnar trip catalogue. The mapped files are
+    shared through the OS page cache by every process that opens the same catalogue.
+    Indexing returns trips in the same dict format as data/trips_data.json.
+    """
+
+    def __init__(self, catalogue_dir):
+        """
+        Initialize the TripCatalogue instance.
+
+        Args:
+            catalogue_dir (str): Directory created by build_catalogue, or one of its version directories.
+        """
+        self.catalogue_dir = catalogue_dir = _resolve(catalogue_dir)
+        with open(os.path.join(catalogue_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(catalogue_dir, f"{name}.npy"), mmap_mode="r")
+        self.string_columns = {name: load(_column_file(name)) for name in STRING_COLUMNS}
+        self.cost = load("cost")
+        self.duration = load("duration")
+        self.activity_refs = load("activity_refs")
+        self.activity_offsets = load("activity_offsets")
+        self.string_offsets = load("string_offsets")
+        strings_path = os.path.join(catalogue_dir, "strings.bin")
+        if os.path.getsize(strings_path):
+            self.strings = np.memmap(strings_path, dtype=np.uint8, mode="r")
+        else:
+            self.strings = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def __getitem__(self, trip_id):
+        if not 0 <= trip_id < len(self):
+            raise IndexError(trip_id)
+        record = {name: self.string(column[trip_id]) for name, column in self.string_columns.items()}
+        return {
+            "Country": record["Country"],
+            "City": record["City"],
+            "Start date": record["Start date"],
+            "Count of days": int(self.duration[trip_id]),
+            "Cost in EUR": int(self.cost[trip_id]),
+            "Extra activities": self.activities(trip_id),
+            "Trip details": record["Trip details"],
+        }
+
+    def __iter__(self):
+        for trip_id in range(len(self)):
+            yield self[trip_id]
+
+    def string(self, ref):
+        """
+        Decode an entry of the string table.
+        """
+        start, end = self.string_offsets[ref], self.string_offsets[ref + 1]
+        return self.strings[start:end].tobytes().decode("utf-8")
+
+    def activities(self, trip_id):
+        """
+        Return the extra activities of a trip.
+        """
+        start, end = self.activity_offsets[trip_id], self.activity_offsets[trip_id + 1]
+        return [self.string(ref) for ref in self.activity_refs[start:end]]
+
+
+def load_catalogue(json_path, catalogue_dir):
+    """
+    Open the catalogue, building it first if there is none for the current JSON source.
+
+    Args:
+        json_path (str): Path to data/trips_data.json.
+        catalogue_dir (str): Directory holding the compiled catalogue.
+
+    Returns:
+        TripCatalogue: Memory-mapped catalogue.
+    """
+    # The version directory is found from the source hash, so a concurrent rebuild moving the
+    # CURRENT pointer cannot hand this process a catalogue of another source
+    version_dir = os.path.join(catalogue_dir, _version_name(_file_sha256(json_path)))
+    if not os.path.exists(os.path.join(version_dir, "meta.json")):
+        version_dir = build_catalogue(json_path, catalogue_dir)
+    return TripCatalogue(version_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile trips JSON into a memory-mapped columnar catalogue.")
+    parser.add_argument("--source", default=os.path.join("data", "trips_data.json"))
+    parser.add_argument("--out", default=os.path.join("data", "trips_catalogue"))
+    args = parser.parse_args()
+    build_catalogue(args.source, args.out)
+    print(f"Catalogue with {len(TripCatalogue(args.out))} trips written to {args.out}")
@@ -0,0 +1,128 @@
+from bisect import bisect_left, bisect_right
+
+
+def _normalize(value):
+    return str(value).strip().lower()
+
+
+class SortedColumn:
+    """
+    A sorted array of (value, trip id) pairs answering range queries with binary search, plus the
+    values in trip id order for checking a single trip.
+    """
+
+    def __init__(self, values):
+        """
+        Initialize the SortedColumn instance.
+
+        Args:
+            values (list): Column values, one per trip, in trip id order.
+        """
+        self.values = list(values)
+        pairs = sorted((value, trip_id) for trip_id, value in enumerate(self.values))
+        self.keys = [value for value, _ in pairs]
+        self.ids = [trip_id for _, trip_id in pairs]
+
+    def bounds(self, low=None, high=None):
+        """
+        Return the (start, end) positions of the values within [low, high]. Open bounds are given as None.
+        """
+        start = 0 if low is None else bisect_left(self.keys, low)
+        end = len(self.keys) if high is None else bisect_right(self.keys, high)
+        return start, end
+
+    def range(self, low=None, high=None):
+        """
+        Return ids of trips whose value lies within [low, high]. Open bounds are given as None.
+        """
+        start, end = self.bounds(low, high)
+        return self.ids[start:end]
+
+    def contains(self, trip_id, low=None, high=None):
+        """
+        Check whether the value of one trip lies within [low, high].
+        """
+        value = self.values[trip_id]
+        return (low is None or value >= low) and (high is None or value <= high)
+
+
+class TripIndex:
+    """
+    Precomputed indexes over the trip catalogue used to answer fetch_trip_details
+    without scanning every trip.
+    """
+
+    def __init__(self, trips):
+        """
+        Build hash indexes on country, city and activity, and sorted columns on
+        start date, cost and duration.
+
+        Args:
+            trips (list of dict): Trips in the format of data/trips_data.json.
+        """
+        self.trips = trips
+        self.by_country = {}
+        self.by_city = {}
+        self.by_activity = {}
+        for trip_id, trip in enumerate(trips):
+            self.by_country.setdefault(_normalize(trip["Country"]), set()).add(trip_id)
+            self.by_city.setdefault(_normalize(trip["City"]), set()).add(trip_id)
+            for activity in trip["Extra activities"]:
+                self.by_activity.setdefault(_normalize(activity), set()).add(trip_id)
+        self.start_date = SortedColumn([trip["Start date"] for trip in trips])
+        self.cost = SortedColumn([trip["Cost in EUR"] for trip in trips])
+        self.duration = SortedColumn([trip["Count of days"] for trip in trips])
+
+    def search(self, country=None, city=None, activities=None, start_date_from=None, start_date_to=None,
+               min_cost=None, max_cost=None, min_days=None, max_days=None):
+        """
+        Find trips matching all of the given criteria.
+
+        Args:
+            country (str, optional): Country name, case-insensitive.
+            city (str, optional): City name, case-insensitive.
+            activities (list of str, optional): Activities the trip must all include, case-insensitive.
+            start_date_from (str, optional): Earliest start date in YYYY-MM-DD format.
+            start_date_to (str, optional): Latest start date in YYYY-MM-DD format.
+            min_cost (int, optional): Minimum cost in EUR.
+            max_cost (int, optional): Maximum cost in EUR.
+            min_days (int, optional): Minimum trip length in days.
+            max_days (int, optional): Maximum trip length in days.
+
+        Returns:
+            list of int: Ids of matching trips in ascending order.
+        """
+        postings = []
+        if country:
+            postings.append(self.by_country.get(_normalize(country), set()))
+        if city:
+            postings.append(self.by_city.get(_normalize(city), set()))
+        for activity in activities or []:
+            postings.append(self.by_activity.get(_normalize(activity), set()))
+        ranges = [
+            (column, low, high)
+            for column, low, high in ((self.start_date, start_date_from, start_date_to),
+                                      (self.cost, min_cost, max_cost),
+                                      (self.duration, min_days, max_days))
+            if low is not None or high is not None
+        ]
+
+        if not postings and not ranges:
+            return list(range(len(self.trips)))
+
+        # Only the most selective criterion is enumerated; every other one is checked per candidate,
+        # so the cost follows the smallest posting list or range rather than all matching trips
+        range_bounds = [column.bounds(low, high) for column, low, high in ranges]
+        sizes = [len(posting) for posting in postings] + [end - start for start, end in range_bounds]
+        driver = min(range(len(sizes)), key=sizes.__getitem__)
+        if driver < len(postings):
+            candidates = postings.pop(driver)
+        else:
+            column, _, _ = ranges.pop(driver - len(postings))
+            start, end = range_bounds[driver - len(postings)]
+            candidates = (column.ids[i] for i in range(start, end))
+        return sorted(
+            trip_id for trip_id in candidates
+            if all(trip_id in posting for posting in postings)
+            and all(column.contains(trip_id, low, high) for column, low, high in ranges)
+        )
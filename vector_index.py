@@ -0,0 +1,184 @@
+import json
+import os
+
+import numpy as np
+
+from ingest_manifest import content_hash
+from instrumentation import telemetry
+from query_filters import metadata_matches
+
+INDEX_VERSION = 1
+EMBEDDED_TEXTS = telemetry.counter("nomad_embedded_texts_total", "Texts sent to the embedding function.")
+
+
+def _embedding_function_name(embedding_function):
+    name = getattr(embedding_function, "name", None)
+    return name() if callable(name) else type(embedding_function).__name__
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    """
+    An in-process cosine similarity index over the documents of one collection, persisted as
+    a NumPy matrix next to the Chroma database. Search is exact by default; with use_hnsw an
+    HNSW graph (hnswlib) is built and persisted as well. query() returns results in the
+    format of a Chroma query, so the index can stand in for a collection.
+    """
+
+    def __init__(self, path, embedding_function, use_hnsw=False):
+        """
+        Initialize the VectorIndex instance and load the persisted index if it was built
+        with the same embedding function.
+
+        Args:
+            path (str): Path prefix of the index files (.npy, .json and .hnsw are appended).
+            embedding_function (callable): Chroma-compatible embedding function for documents.
+            use_hnsw (bool, optional): Search an HNSW graph instead of the exact matrix. Defaults to False.
+        """
+        self.path = path
+        self.embedding_function = embedding_function
+        self.use_hnsw = use_hnsw
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.hashes = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.hnsw = None
+        self._load()
+
+    def _load(self):
+        meta_path = self.path + ".json"
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION or meta.get("embedding_function") != _embedding_function_name(self.embedding_function):
+            return
+        self.ids = meta["ids"]
+        self.documents = meta["documents"]
+        self.metadatas = meta["metadatas"]
+        self.hashes = meta["hashes"]
+        self.matrix = np.load(self.path + ".npy")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sync(self, ids, documents, metadatas, batch_size=100):
+        """
+        Bring the index in line with the source data, embedding only new or changed rows,
+        and persist it if anything changed.
+
+        Args:
+            ids (list of str): Row ids.
+            documents (list of str): Row documents.
+            metadatas (list of dict): Row metadatas.
+            batch_size (int, optional): Number of rows sent to the embedding function at once. Defaults to 100.
+
+        Returns:
+            int: Number of rows embedded.
+        """
+        hashes = [content_hash(document, metadata) for document, metadata in zip(documents, metadatas)]
+        known = {row_id: (row_hash, row) for row, (row_id, row_hash) in enumerate(zip(self.ids, self.hashes))}
+        vectors = [None] * len(ids)
+        missing = []
+        for i, (row_id, row_hash) in enumerate(zip(ids, hashes)):
+            previous = known.get(row_id)
+            if previous is not None and previous[0] == row_hash:
+                vectors[i] = self.matrix[previous[1]]
+            else:
+                missing.append(i)
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            for i, embedding in zip(batch, self.embedding_function([documents[i] for i in batch])):
+                vectors[i] = np.asarray(embedding, dtype=np.float32)
+            EMBEDDED_TEXTS.inc(len(batch), kind="document")
+
+        changed = bool(missing) or list(ids) != self.ids
+        self.ids, self.documents, self.metadatas, self.hashes = list(ids), list(documents), list(metadatas), hashes
+        self.matrix = _normalize(np.vstack(vectors).astype(np.float32)) if vectors else np.zeros((0, 0), dtype=np.float32)
+        if changed:
+            self._save()
+        if self.use_hnsw:
+            self._load_hnsw(rebuild=changed)
+        return len(missing)
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Written to temporary files and renamed, so a crash never leaves a half-written index
+        np.save(self.path + ".tmp.npy", self.matrix)
+        with open(self.path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "embedding_function": _embedding_function_name(self.embedding_function),
+                "ids": self.ids,
+                "documents": self.documents,
+                "metadatas": self.metadatas,
+                "hashes": self.hashes,
+            }, f)
+        os.replace(self.path + ".tmp.npy", self.path + ".npy")
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+
+    def _load_hnsw(self, rebuild):
+        import hnswlib
+
+        hnsw_path = self.path + ".hnsw"
+        self.hnsw = None
+        if not len(self.ids):
+            return
+        index = hnswlib.Index(space="cosine", dim=self.matrix.shape[1])
+        if not rebuild and os.path.exists(hnsw_path):
+            index.load_index(hnsw_path, max_elements=len(self.ids))
+        else:
+            index.init_index(max_elements=len(self.ids), ef_construction=200, M=16)
+            index.add_items(self.matrix, np.arange(len(self.ids)))
+            index.save_index(hnsw_path)
+        self.hnsw = index
+
+    def query(self, query_embeddings, n_results=5, where=None, **kwargs):
+        """
+        Find the documents most similar to each query embedding.
+
+        Args:
+            query_embeddings (list): Query vectors.
+            n_results (int, optional): Number of results per query. Defaults to 5.
+            where (dict, optional): Chroma where filter the metadata of the results must match.
+                Filtered queries search the matching rows exactly, also with use_hnsw.
+
+        Returns:
+            dict: Results with keys 'ids', 'documents', 'metadatas' and 'distances' (cosine distance),
+                each holding one list per query.
+        """
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        # The filter usually leaves a few rows, which are cheaper to scan than to look up in the graph
+        candidates = None
+        if where:
+            candidates = np.array([row for row, metadata in enumerate(self.metadatas) if metadata_matches(metadata, where)],
+                                  dtype=np.int64)
+        k = min(n_results, len(self.ids) if candidates is None else len(candidates))
+        for query in queries:
+            if k == 0:
+                rows, distances = [], []
+            elif self.hnsw is not None and candidates is None:
+                self.hnsw.set_ef(max(50, k))
+                labels, hnsw_distances = self.hnsw.knn_query(query, k=k)
+                rows, distances = labels[0].tolist(), hnsw_distances[0].tolist()
+            else:
+                matrix = self.matrix if candidates is None else self.matrix[candidates]
+                similarities = matrix @ query
+                top = np.argpartition(-similarities, k - 1)[:k] if k < len(similarities) else np.arange(len(similarities))
+                top = top[np.argsort(-similarities[top], kind="stable")]
+                rows = (top if candidates is None else candidates[top]).tolist()
+                distances = [1.0 - float(similarities[i]) for i in top]
+            results["ids"].append([self.ids[row] for row in rows])
+            results["documents"].append([self.documents[row] for row in rows])
+            results["metadatas"].append([self.metadatas[row] for row in rows])
+            results["distances"].append(distances)
+        return results